@@ -0,0 +1,154 @@
+"""
+Graph functions on the arcs (TLINKs) of a document, shared by optimizer.py and clinicaloptimizer.py
+
+This code is licensed under the Apache License, Version 2.0. You may
+obtain a copy of this license in the LICENSE file in the root
+directory of this source tree or at
+http://www.apache.org/licenses/LICENSE-2.0.
+Any modifications or derivative works of this code must retain this
+copyright notice, and modified files need to carry a notice
+indicating that they have been altered from the originals.
+
+If you use this code, please cite our paper:
+@article{Kerr2020,
+  author    = {Catherine Kerr and Terri Hoare and Paula Carroll and Jakub Marecek},
+  title     = {Integer-Programming Ensemble of Temporal-Relations Classifiers},
+  journal   = {Data Mining and Knowledge Discovery},
+  volume    = {to appear},
+  year      = {2020},
+  url       = {http://arxiv.org/abs/1412.1866},
+  archivePrefix = {arXiv},
+  eprint    = {1412.1866},
+}
+"""
+
+###########################################################################################################
+#
+## Triad enumeration
+
+# Index arcs by source node, keeping the order in which the arcs are given
+def Source_index(arcs):
+    bySource = {}
+    for arc in arcs:
+        if not arc[0] in bySource:
+            bySource[arc[0]] = []
+        bySource[arc[0]].append(arc)
+    return bySource
+
+# Connected tri-graphs (i,j,k) such that (i,j), (j,k) and (i,k) are all arcs
+# Only arcs leaving j are candidates for (j,k), and (i,k) is looked up in a hash set, so the cost is
+# proportional to the number of two-step paths rather than to the square of the number of arcs.
+# Triads come out in the same order as from the pairwise loop over all arcs
+def Triads_init(arcs):
+    arcs = list(arcs)
+    arcSet = set(arcs)
+    bySource = Source_index(arcs)
+    retval = []
+    for arc1 in arcs:
+        i = arc1[0]
+        j = arc1[1]
+        for arc2 in bySource.get(j, ()):
+            k = arc2[1]
+            if arc1 != arc2 and (i,k) in arcSet:
+                retval.append((i,j,k))
+    return retval
+
+###########################################################################################################
+#
+## Connected components
+
+# Root of an arc in the union-find forest, halving the path on the way up
+def Find(parent, n):
+    while parent[n] != n:
+        parent[n] = parent[parent[n]]
+        n = parent[n]
+    return n
+
+# Components of the arc graph in which the three arcs of every triad are linked
+# Arcs in different components share no transitivity constraint, so each component can be optimised on its own
+# Components are listed in order of their first arc, and arcs keep their order within a component
+def Components_init(arcs, triads):
+    arcs = list(arcs)
+    arcIndex = dict((arc, n) for (n, arc) in enumerate(arcs))
+    parent = list(range(len(arcs)))
+    for (i,j,k) in triads:
+        root = Find(parent, arcIndex[(i,j)])
+        for arc in ((j,k), (i,k)):
+            other = Find(parent, arcIndex[arc])
+            if other != root:
+                parent[other] = root
+    components = {}
+    retval = []
+    for (n, arc) in enumerate(arcs):
+        root = Find(parent, n)
+        if not root in components:
+            components[root] = []
+            retval.append(components[root])
+        components[root].append(arc)
+    return retval
+
+###########################################################################################################
+#
+## Tree decomposition
+
+# Elimination order of the arc graph, taking an arc of fewest neighbours each time and linking its neighbours
+# to each other. The width is the largest number of neighbours an arc has when it is eliminated, and the
+# neighbours of each arc with the arc itself are the bags of a tree decomposition of that width.
+# Returns (order, width), or (None, width) as soon as the width exceeds maxWidth
+def Elimination_init(arcs, triads, maxWidth=None):
+    neighbours = dict((arc, set()) for arc in arcs)
+    for (i,j,k) in triads:
+        triadArcs = set(((i,j), (j,k), (i,k)))
+        for arc in triadArcs:
+            neighbours[arc] |= triadArcs - set((arc,))
+    byDegree = {}
+    for arc in neighbours:
+        byDegree.setdefault(len(neighbours[arc]), set()).add(arc)
+    order = []
+    width = 0
+    degree = 0
+    while len(neighbours) > 0:
+        degree = max(degree - 1, 0)                    # eliminating an arc lowers the degree of others by one at most
+        while len(byDegree.get(degree, ())) == 0:
+            degree += 1
+        arc = byDegree[degree].pop()
+        width = max(width, degree)
+        if maxWidth != None and width > maxWidth:
+            return (None, width)
+        order.append(arc)
+        others = neighbours.pop(arc)
+        for other in others:
+            byDegree[len(neighbours[other])].discard(other)
+            neighbours[other] |= others
+            neighbours[other] -= set((other, arc))
+            byDegree.setdefault(len(neighbours[other]), set()).add(other)
+    return (order, width)
+
+###########################################################################################################
+#
+## Band order
+
+# Entities in Cuthill-McKee order: breadth first from an entity of fewest neighbours, visiting the neighbours of
+# each entity by increasing number of neighbours, one connected part of the graph after the other. Entities joined
+# by an arc end up close together in the order, as they are in the text, where arcs join entities of the same or
+# of nearby sentences
+def Band_init(arcs):
+    neighbours = {}
+    for (i, j) in arcs:
+        neighbours.setdefault(i, set()).add(j)
+        neighbours.setdefault(j, set()).add(i)
+    degree = lambda entity: (len(neighbours[entity]), entity)
+    order = []
+    seen = set()
+    for root in sorted(neighbours, key=degree):
+        if root in seen:
+            continue
+        seen.add(root)
+        n = len(order)
+        order.append(root)
+        while n < len(order):                       # order is also the queue of the breadth-first search
+            for other in sorted(neighbours[order[n]] - seen, key=degree):
+                seen.add(other)
+                order.append(other)
+            n += 1
+    return order
@@ -0,0 +1,604 @@
+"""
+Scaling benchmarks for the optimiser on synthetic documents
+Input parameters
+"bench="name          benchmark to run - default triads
+"sizes="n1,n2,...     numbers of entities in the synthetic documents - default 50,100,200,400,800
+"window="w            arcs join entities at most w positions apart - default 10
+"seed="s              seed for the random documents - default 0
+"backend="name        optimizer backend used by benchmarks that solve the IP - default matrix
+"solver="name         solver used by benchmarks that solve the IP - default cplex
+"docs="n              number of documents per size in the documents benchmark - default 20
+"epsilon="e           weight threshold of the sparse domains in the sparse benchmark - default 0
+"batch="n             number of documents per solver call in the batch benchmark - default 10
+"treewidth="w         largest width solved by dynamic programming in the treewidth benchmark - default 4
+
+This code is licensed under the Apache License, Version 2.0. You may
+obtain a copy of this license in the LICENSE file in the root
+directory of this source tree or at
+http://www.apache.org/licenses/LICENSE-2.0.
+Any modifications or derivative works of this code must retain this
+copyright notice, and modified files need to carry a notice
+indicating that they have been altered from the originals.
+
+If you use this code, please cite our paper:
+@article{Kerr2020,
+  author    = {Catherine Kerr and Terri Hoare and Paula Carroll and Jakub Marecek},
+  title     = {Integer-Programming Ensemble of Temporal-Relations Classifiers},
+  journal   = {Data Mining and Knowledge Discovery},
+  volume    = {to appear},
+  year      = {2020},
+  url       = {http://arxiv.org/abs/1412.1866},
+  archivePrefix = {arXiv},
+  eprint    = {1412.1866},
+}
+"""
+
+import glob
+import math
+import os
+import random
+import sys
+import tempfile
+from time33 import perf_counter
+import arcgraph
+import optimizer
+from classifier import Classifier, Ensemble
+
+###########################################################################################################
+#
+## Synthetic documents
+
+# Builds a dictionary of arcs in the format returned by Classifier.arcProbability (weight formula '1')
+# Entities e1..en are in text order, arcs join entities at most 'window' positions apart, and each arc
+# gets votes from up to numClassifiers classifiers that mostly agree on one reltype
+def randomArcs(numEntities, window=10, density=0.5, numClassifiers=5, numRels=15, seed=0):
+    rng = random.Random(seed)
+    names = sorted("e"+str(n) for n in range(1, numEntities+1))  # global ids are compared as strings
+    v = {}
+    for a in range(len(names)):
+        for b in range(a+1, min(a+window+1, len(names))):
+            if rng.random() > density:
+                continue
+            votes = [0]*numRels
+            favourite = rng.randrange(numRels-1)
+            numVotes = rng.randint(1, numClassifiers)
+            for cl in range(numVotes):
+                if rng.random() < 0.7:
+                    votes[favourite] += 1
+                else:
+                    votes[rng.randrange(numRels-1)] += 1
+            v[(names[a], names[b])] = tuple(vote/float(numVotes) for vote in votes)
+    return v
+
+# Triad enumeration as originally written in optimizer.Connected_Arcs_init - kept as the reference
+def pairwiseTriads(v):
+    retval = []
+    for arc1 in v:
+        i = arc1[0]
+        ij = arc1[1]
+        for arc2 in v:
+            if arc1 != arc2:
+               jk = arc2[0]
+               k = arc2[1]
+               if ij == jk:
+                  ik = (i,k)
+                  if ik in v:
+                    retval.append((i,ij,k))
+    return retval
+
+def timed(f, *args, **kwargs):
+    start = perf_counter()
+    result = f(*args, **kwargs)
+    return (result, perf_counter() - start)
+
+###########################################################################################################
+#
+## Benchmarks
+
+def benchTriads(params):
+    print "%8s %8s %8s %12s %12s %8s" % ("entities", "arcs", "triads", "pairwise(s)", "indexed(s)", "speedup")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (old, oldTime) = timed(pairwiseTriads, v)
+        (new, newTime) = timed(arcgraph.Triads_init, v)
+        if old != new:
+            raise ValueError("Indexed triads differ from pairwise triads for %d entities" % n)
+        print "%8d %8d %8d %12.4f %12.4f %8.1f" % (n, len(v), len(new), oldTime, newTime, oldTime/max(newTime, 1e-9))
+    return
+
+# Objective value of an assignment in the rDict format returned by optimizer.main
+def objective(v, rDict):
+    return sum(v[arc][rDict[arc].index(1)] for arc in v)
+
+# Model construction time of the pyomo and matrix backends, then solve both and compare the optimum
+def benchBuild(params):
+    print "%8s %8s %8s %12s %12s %12s %12s %12s" % ("entities", "arcs", "rows", "pyomo(s)", "matrix(s)",
+                                                   "pyomo obj", "matrix obj", "same labels")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        optimizer.v = v
+        (model, pyomoTime) = timed(optimizer.Model_init, v)
+        (matrixModel, matrixTime) = timed(optimizer.MatrixModel_init, v)
+        pyomoResult = optimizer.main(v, backend='pyomo', solver=params["solver"])
+        matrixResult = optimizer.main(v, backend='matrix', solver=params["solver"])
+        same = sum(1 for arc in v if pyomoResult[arc] == matrixResult[arc])
+        print "%8d %8d %8d %12.4f %12.4f %12.4f %12.4f %12s" % (n, len(v), matrixModel.numConstraints(), pyomoTime, matrixTime,
+              objective(v, pyomoResult), objective(v, matrixResult), "%d/%d" % (same, len(v)))
+    return
+
+# Solve with the backend and solver of the benchmark parameters
+def solve(params, v, **options):
+    return optimizer.main(v, backend=params["backend"], solver=params["solver"], **options)
+
+# Constraint count and solve time of the full and compact transitivity formulations
+def benchFormulation(params):
+    print "%8s %8s %10s %10s %10s %10s %12s %12s %12s %12s" % ("entities", "arcs", "full rows", "full nnz", "cmpct rows",
+          "cmpct nnz", "full(s)", "compact(s)", "full obj", "compact obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        full = optimizer.MatrixModel_init(v, 'full')
+        compact = optimizer.MatrixModel_init(v, 'compact')
+        (fullResult, fullTime) = timed(solve, params, v, formulation='full')
+        (compactResult, compactTime) = timed(solve, params, v, formulation='compact')
+        print "%8d %8d %10d %10d %10d %10d %12.4f %12.4f %12.4f %12.4f" % (n, len(v), full.numConstraints(), full.Aub.nnz,
+              compact.numConstraints(), compact.Aub.nnz, fullTime, compactTime, objective(v, fullResult), objective(v, compactResult))
+    return
+
+# Solve time with and without the repaired max-probability warm start, and the gap of the warm start
+def benchWarmstart(params):
+    print "%8s %8s %12s %12s %12s %12s %12s %10s" % ("entities", "arcs", "cold(s)", "warm(s)", "cold obj", "start obj",
+          "warm obj", "gap")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (coldResult, coldTime) = timed(solve, params, v)
+        (warmResult, warmTime) = timed(solve, params, v, warmstart=True)
+        print "%8d %8d %12.4f %12.4f %12.4f %12.4f %12.4f %10.6f" % (n, len(v), coldTime, warmTime, objective(v, coldResult),
+              optimizer.stats['start'], objective(v, warmResult), optimizer.stats['gap'])
+    return
+
+# Variables, constraints and solve time with and without dominance and path-consistency pruning
+def benchPrune(params):
+    print "%8s %8s %10s %10s %10s %10s %12s %12s %12s %12s" % ("entities", "arcs", "vars", "rows", "pruned vars",
+          "pruned rows", "full(s)", "pruned(s)", "full obj", "pruned obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (fullResult, fullTime) = timed(solve, params, v)
+        (fullVariables, fullConstraints) = (optimizer.stats['variables'], optimizer.numConstraints)
+        (prunedResult, prunedTime) = timed(solve, params, v, prune=True)
+        print "%8d %8d %10d %10d %10d %10d %12.4f %12.4f %12.4f %12.4f" % (n, len(v), fullVariables, fullConstraints,
+              optimizer.stats['variables'], optimizer.numConstraints, fullTime, prunedTime, objective(v, fullResult),
+              objective(v, prunedResult))
+    return
+
+# Variables, constraints, solve time and objective with sparse per-arc domains
+def benchSparse(params):
+    print "%8s %8s %10s %10s %10s %10s %12s %12s %12s %12s" % ("entities", "arcs", "vars", "rows", "sparse vars",
+          "sparse rows", "full(s)", "sparse(s)", "full obj", "sparse obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (fullResult, fullTime) = timed(solve, params, v)
+        (fullVariables, fullConstraints) = (optimizer.stats['variables'], optimizer.numConstraints)
+        (sparseResult, sparseTime) = timed(solve, params, v, epsilon=params["epsilon"])
+        print "%8d %8d %10d %10d %10d %10d %12.4f %12.4f %12.4f %12.4f" % (n, len(v), fullVariables, fullConstraints,
+              optimizer.stats['variables'], optimizer.numConstraints, fullTime, sparseTime, objective(v, fullResult),
+              objective(v, sparseResult))
+    return
+
+# Variables, constraints, solve time and objective with the unanimous arcs fixed (optimizer.Fixed_init)
+def benchFix(params):
+    print "%8s %8s %8s %10s %10s %10s %10s %12s %12s %12s %12s" % ("entities", "arcs", "fixed", "vars", "rows",
+          "fixed vars", "fixed rows", "full(s)", "fixed(s)", "full obj", "fixed obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (fullResult, fullTime) = timed(solve, params, v)
+        (fullVariables, fullConstraints) = (optimizer.stats['variables'], optimizer.numConstraints)
+        (fixedResult, fixedTime) = timed(solve, params, v, fix=1.0)
+        print "%8d %8d %8d %10d %10d %10d %10d %12.4f %12.4f %12.4f %12.4f" % (n, len(v), optimizer.stats['fixed'],
+              fullVariables, fullConstraints, optimizer.stats['variables'], optimizer.numConstraints, fullTime, fixedTime,
+              objective(v, fullResult), objective(v, fixedResult))
+    return
+
+# Solve time and objective of the IP and of the rounded LP relaxation (opt '4'), with the LP bound
+def benchRelax(params):
+    print "%8s %8s %12s %12s %12s %12s %12s" % ("entities", "arcs", "ip(s)", "lp(s)", "ip obj", "rounded obj", "lp bound")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (ipResult, ipTime) = timed(solve, params, v)
+        (lpResult, lpTime) = timed(solve, params, v, opt='4')
+        print "%8d %8d %12.4f %12.4f %12.4f %12.4f %12.4f" % (n, len(v), ipTime, lpTime, objective(v, ipResult),
+              objective(v, lpResult), optimizer.stats['bound'])
+    return
+
+# Time, objective and broken triads left by the local search (opt '3') as documents grow - no solver involved
+def benchSearch(params):
+    print "%8s %8s %8s %12s %12s %12s %10s" % ("entities", "arcs", "triads", "search(s)", "argmax obj", "search obj",
+          "broken")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (result, searchTime) = timed(optimizer.main, v, '3')
+        argmax = dict((arc, optimizer.Argmax_init(v[arc])) for arc in v)
+        print "%8d %8d %8d %12.4f %12.4f %12.4f %10d" % (n, len(v), len(optimizer.Connected_Arcs_init(v)), searchTime,
+              objective(v, argmax), objective(v, result), optimizer.stats['violations'])
+    return
+
+# Width of the tree decomposition, and solve time and objective by dynamic programming and by the IP - documents
+# wider than params["treewidth"] go to the solver in both columns
+def benchTreewidth(params):
+    print "%8s %8s %8s %8s %12s %12s %12s %12s" % ("entities", "arcs", "triads", "width", "dp(s)", "ip(s)", "dp obj",
+          "ip obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (dpResult, dpTime) = timed(solve, params, v, treewidth=params["treewidth"])
+        width = optimizer.stats['width']
+        (ipResult, ipTime) = timed(solve, params, v)
+        print "%8d %8d %8d %8d %12.4f %12.4f %12.4f %12.4f" % (n, len(v), len(optimizer.Connected_Arcs_init(v)), width,
+              dpTime, ipTime, objective(v, dpResult), objective(v, ipResult))
+    return
+
+# Time and objective of the whole document against windows of params["shard"] entities overlapping by
+# params["overlap"] (optimizer.Shard_main), and the number of windows and of arcs re-solved by the stitch
+def benchShard(params):
+    print "%8s %8s %8s %12s %12s %12s %12s" % ("entities", "windows", "stitched", "whole(s)", "sharded(s)",
+          "whole obj", "sharded obj")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        (wholeResult, wholeTime) = timed(solve, params, v)
+        (shardResult, shardTime) = timed(solve, params, v, shard=params["shard"], overlap=params["overlap"],
+                                         workers=params["parallel"])
+        print "%8d %8d %8d %12.4f %12.4f %12.4f %12.4f" % (n, optimizer.stats.get('windows', 1),
+              optimizer.stats.get('stitched', 0), wholeTime, shardTime, objective(v, wholeResult),
+              objective(v, shardResult))
+    return
+
+# Triads broken by the sharded assignment, solved without a limit and with limits that stop the windows or the
+# stitch part way - a fraction of the time taken without one. Raises ValueError if any triad is broken
+def benchStitch(params):
+    print "%8s %8s %8s %12s %12s %10s %10s" % ("entities", "windows", "stitched", "limit(s)", "time(s)", "status",
+          "broken")
+    for n in params["sizes"]:
+        v = randomArcs(n, window=params["window"], seed=params["seed"])
+        triads = optimizer.Connected_Arcs_init(v)
+        (result, fullTime) = timed(solve, params, v, shard=params["shard"], overlap=params["overlap"])
+        for limit in [None, 0.0, fullTime/4, fullTime/2, fullTime*3/4]:
+            (result, resultTime) = timed(solve, params, v, shard=params["shard"], overlap=params["overlap"],
+                                         timelimit=limit)
+            broken = len(optimizer.Violated_init(result, triads))
+            print "%8d %8d %8d %12s %12.4f %10s %10d" % (n, optimizer.stats.get('windows', 1),
+                  optimizer.stats.get('stitched', 0), "none" if limit == None else "%.4f" % limit, resultTime,
+                  optimizer.stats['status'], broken)
+            if broken > 0:
+                raise ValueError("%d triads broken by the sharded assignment of %d entities" % (broken, n))
+    return
+
+# Time per document over many small documents, where the fixed cost of each solver call dominates
+# Compare solver=highs or solver=ortools (in process) with solver=cbc or solver=cplex (LP file and subprocess)
+def benchDocuments(params):
+    print "%8s %8s %12s %12s" % ("entities", "docs", "total(s)", "per doc(s)")
+    for n in params["sizes"]:
+        docs = [randomArcs(n, window=params["window"], seed=params["seed"]+d) for d in range(params["docs"])]
+        start = perf_counter()
+        for v in docs:
+            solve(params, v)
+        total = perf_counter() - start
+        print "%8d %8d %12.4f %12.4f" % (n, len(docs), total, total/len(docs))
+    return
+
+# Time per document solving the documents one by one and in block-diagonal batches (optimizer.Batch_main), with
+# opt params["opt"]. Batch_main solves integer batches one by one with a solver in optimizer.branchingSolvers
+def benchBatch(params):
+    print "%8s %8s %8s %12s %12s %12s %12s" % ("entities", "docs", "batch", "single(s)", "batched(s)", "single obj",
+          "batched obj")
+    for n in params["sizes"]:
+        docs = [randomArcs(n, window=params["window"], seed=params["seed"]+d) for d in range(params["docs"])]
+        (singleResults, singleTime) = timed(lambda: [optimizer.main(v, params["opt"], backend=params["backend"],
+                                                                    solver=params["solver"]) for v in docs])
+        batches = [docs[b:b+params["batch"]] for b in range(0, len(docs), params["batch"])]
+        (batchResults, batchTime) = timed(lambda: sum([optimizer.Batch_main(batch, params["opt"], backend=params["backend"],
+                                                       solver=params["solver"]) for batch in batches], []))
+        print "%8d %8d %8d %12.4f %12.4f %12.4f %12.4f" % (n, len(docs), params["batch"], singleTime/len(docs),
+              batchTime/len(docs), sum(objective(v, r) for (v, r) in zip(docs, singleResults)),
+              sum(objective(v, r) for (v, r) in zip(docs, batchResults)))
+    return
+
+# Finishing time of the last of params["parallel"] workers that each take the next document when free
+def makespan(times, workers):
+    free = [0.0]*workers
+    for t in times:
+        free[free.index(min(free))] += t
+    return max(free)
+
+# Documents of all params["sizes"] in random order, solved with optimizer.Parallel_main, and the makespan of their
+# actual times on params["parallel"] workers in file order, in predicted longest-first order (what Parallel_main
+# does) and in actual longest-first order. Run it twice with the same timings file to see the calibrated estimate
+def benchSchedule(params):
+    docs = [randomArcs(n, window=params["window"], seed=params["seed"]+d) for n in params["sizes"]
+            for d in range(params["docs"])]
+    random.Random(params["seed"]).shuffle(docs)
+    (results, wallTime) = timed(optimizer.Parallel_main, docs, '1', params["parallel"], None, params["timings"],
+                                backend=params["backend"], solver=params["solver"])
+    actual = [timing[4] for timing in optimizer.timings]
+    predicted = [timing[3] for timing in optimizer.timings]
+    byPredicted = [actual[d] for d in sorted(range(len(docs)), key=lambda d: -predicted[d])]
+    print "%8s %8s %12s %12s %12s %12s" % ("docs", "workers", "wall(s)", "file(s)", "predicted(s)", "actual(s)")
+    print "%8d %8d %12.4f %12.4f %12.4f %12.4f" % (len(docs), params["parallel"], wallTime,
+          makespan(actual, params["parallel"]), makespan(byPredicted, params["parallel"]),
+          makespan(sorted(actual, reverse=True), params["parallel"]))
+    print "cost model", " ".join("%.6f" % c for c in optimizer.costModel)
+    return
+
+# Documents of all params["sizes"] solved with optimizer.Parallel_main on params["parallel"] workers, with decompose
+# and with shard, against the same documents solved one by one. Raises ValueError if an objective differs
+def benchParallel(params):
+    docs = [randomArcs(n, window=params["window"], seed=params["seed"]+d) for n in params["sizes"]
+            for d in range(params["docs"])]
+    print "%-16s %8s %8s %12s %12s %12s %12s" % ("options", "docs", "workers", "single(s)", "parallel(s)", "single obj",
+          "parallel obj")
+    for options in [{"decompose": True}, {"shard": params["shard"], "overlap": params["overlap"]}]:
+        (singleResults, singleTime) = timed(lambda: [solve(params, v, **options) for v in docs])
+        (parallelResults, parallelTime) = timed(optimizer.Parallel_main, docs, '1', params["parallel"],
+                                                backend=params["backend"], solver=params["solver"], **options)
+        singleObjective = sum(objective(v, r) for (v, r) in zip(docs, singleResults))
+        parallelObjective = sum(objective(v, r) for (v, r) in zip(docs, parallelResults))
+        print "%-16s %8d %8d %12.4f %12.4f %12.4f %12.4f" % (",".join(sorted(options)), len(docs), params["parallel"],
+              singleTime, parallelTime, singleObjective, parallelObjective)
+        if abs(singleObjective - parallelObjective) > 1e-6:
+            raise ValueError("Parallel_main with %s found objective %f against %f" % (options, parallelObjective,
+                                                                                     singleObjective))
+    return
+
+# A tml file of numEntities events and times, every fourth a TIMEX3, in sentences of words drawn from a small
+# vocabulary so the same text recurs, and TLINKs between entities at most 'window' positions apart
+def randomTml(filename, numEntities, window=10, density=0.5, seed=0):
+    rng = random.Random(seed)
+    words = ["said", "the", "company", "on", "Monday", "will", "report", "sales", "after", "today"]
+    text = []
+    instances = []
+    ids = []
+    for n in range(1, numEntities + 1):
+        word = rng.choice(words)
+        if n % 4 == 0:
+            ids.append(("timeID", "relatedToTime", "t%d" % n))
+            text.append('<TIMEX3 tid="t%d" type="DATE" value="2020-01-%02d">%s</TIMEX3>' % (n, n % 28 + 1, word))
+        else:
+            ids.append(("eventInstanceID", "relatedToEventInstance", "ei%d" % n))
+            text.append('<EVENT eid="e%d" class="OCCURRENCE">%s</EVENT>' % (n, word))
+            instances.append('<MAKEINSTANCE eventID="e%d" eiid="ei%d" tense="PAST" aspect="NONE" polarity="POS" '
+                             'pos="VERB"/>\n' % (n, n))
+        text.append(" %s %s%s" % (rng.choice(words), rng.choice(words), ".\n" if n % 5 == 0 else " "))
+    tlinks = []
+    for left in range(numEntities):
+        for right in range(left + 1, min(left + window + 1, numEntities)):
+            if rng.random() < density:
+                tlinks.append('<TLINK lid="l%d" relType="%s" %s="%s" %s="%s"/>\n' % (len(tlinks) + 1,
+                              rng.choice(Classifier.relTypes[:14]), ids[left][0], ids[left][2], ids[right][1], ids[right][2]))
+    f = open(filename, 'w')
+    f.write('<?xml version="1.0" ?>\n<TimeML>\n<DOCID>synthetic</DOCID>\n'
+            '<DCT><TIMEX3 tid="t0" type="DATE" value="2020-01-01" functionInDocument="CREATION_TIME">'
+            'January 1, 2020</TIMEX3></DCT>\n<TEXT>\n' + "".join(text) + '\n</TEXT>\n' + "".join(instances) +
+            "".join(tlinks) + '</TimeML>\n')
+    f.close()
+    return
+
+# Classifier.parseTml of each file in params["files"], or of a synthetic tml file of each of params["sizes"]
+# entities, with BeautifulSoup, with lxml iterparse and from the parse cache once filled, and whether all three give
+# the same global and per-classifier state. Run from a directory with reltypes.dat, as ensemble.py
+def benchParse(params):
+    if params["files"] != None:
+        files = sorted(glob.glob(params["files"]))
+    else:
+        directory = tempfile.mkdtemp()
+        files = [os.path.join(directory, "synthetic%d.tml" % n) for n in params["sizes"]]
+        for (n, filename) in zip(params["sizes"], files):
+            randomTml(filename, n, window=params["window"], seed=params["seed"])
+    cache = tempfile.mkdtemp()
+    print "%-24s %8s %12s %12s %12s %8s %6s" % ("file", "tlinks", "bs4(s)", "lxml(s)", "cached(s)", "speedup", "same")
+    for filename in files:
+        (states, times) = ({}, {})
+        for parser in ("bs4", "lxml", "cached"):
+            if parser == "cached":
+                Classifier.setParseCache(cache)
+                Classifier.readTml(filename)                # fills the cache
+            else:
+                Classifier.setParser(parser)
+            classifier = Classifier("PARSE", False, Ensemble())
+            (result, times[parser]) = timed(classifier.parseTml, filename)
+            state = dict((name, value) for (name, value) in classifier.ensemble.__dict__.items()
+                         if not name in ("votes", "globalArcs"))    # compared through the dictionary they are read as
+            state["globalArcs"] = dict(classifier.ensemble.globalArcs.items())
+            states[parser] = (state, classifier.etMaps, classifier.eInstances, classifier.eInstRefs,
+                              classifier.arcs)
+        Classifier.setParseCache(None)
+        print "%-24s %8d %12.4f %12.4f %12.4f %8.2f %6s" % (os.path.basename(filename)[-24:], len(states["bs4"][4]),
+              times["bs4"], times["lxml"], times["cached"], times["bs4"]/times["lxml"],
+              states["bs4"] == states["lxml"] == states["cached"])
+    return
+
+# Classifier.arcProbability as it was before it worked on arrays, looping over arcs, reltypes and classifiers - kept as the reference
+def loopProbability(final):
+    document = final.ensemble
+    formula = document.weightFormula
+    if formula == '4' or formula == '5':
+        for arc in document.globalArcs:
+            arcVotes = document.globalArcs[arc]
+            relTuple = ()
+            for i in range(15):
+                prob = 0 if formula == '4' else 1
+                for cl in document.classifierList:
+                    if arcVotes[cl][i] == 1:
+                        weight = document.getWeight(cl)
+                    else:
+                        weight = 1-document.getWeight(cl)
+                    if formula == '4':
+                        prob += math.log1p(weight)
+                    else:
+                        prob *= weight
+                relTuple += (prob,)
+            document.setFinalClassifier(arc, relTuple)
+        return document.finalArcs
+    if formula == '3' or formula >= '6':
+        totalWeight = float(0)
+        for cl in document.classifierList:
+            totalWeight += document.getWeight(cl)
+        for cl in document.classifierList:
+            document.setWeight(cl, document.getWeight(cl)/totalWeight)
+    if formula >= '6':
+        for arc in document.globalArcs:
+            arcVotes = document.globalArcs[arc]
+            relTuple = ()
+            for i in range(15):
+                prob = 0
+                for cl in document.classifierList:
+                    t = 1 if arcVotes[cl][i] != 1 else 0
+                    if formula == '6' or formula == '7':
+                        prob += t*document.getWeight(cl)
+                    elif formula == '8':
+                        prob += t*document.getWeight(cl)*document.getWeight(cl)
+                    elif formula == '9':
+                        prob += t*math.log1p(document.getWeight(cl)) + t*math.log1p(1-document.getWeight(cl))
+                if formula == '6':
+                    prob = (1 - prob) * document.probReltype[i]
+                else:
+                    prob *= (document.probReltype[i]-1)
+                relTuple += (prob,)
+            document.setFinalClassifier(arc, relTuple)
+        return document.finalArcs
+    for arc in document.globalArcs:
+        arcVotes = document.globalArcs[arc]
+        numClassifiers = float(len(document.classifierList)) if formula != '1' else float(0)
+        relTuple = Classifier.emptyTuple
+        for cl in document.classifierList:
+            if formula == '1' and sum(arcVotes[cl]) >= 1:
+                numClassifiers += 1
+            relTuple = final.addRelTuple(relTuple, arcVotes[cl], cl)
+        if formula == '1':
+            document.setFinalClassifier(arc, tuple(prob/numClassifiers for prob in relTuple))
+        elif formula != '3' or sum(relTuple) >= 0.5:
+            document.setFinalClassifier(arc, relTuple)
+    return document.finalArcs
+
+# Votes of numClassifiers classifiers on the arcs of randomArcs, each classifier detecting an arc with probability
+# 0.8 and then mostly agreeing on one reltype, with weights in (0.5, 1.0) as formulas '4' and '5' require.
+# Classifier("FINAL", True, ...) of the document is returned. Run from a directory with reltypes.dat, as ensemble.py
+def randomEnsemble(numEntities, window=10, density=0.5, numClassifiers=5, seed=0):
+    rng = random.Random(seed)
+    document = Ensemble()
+    final = Classifier("FINAL", True, document)
+    classIDs = ["CLASSIFIER_%d" % c for c in range(numClassifiers)]
+    for classID in classIDs:
+        document.addClassifier(classID)
+        document.setWeight(classID, rng.uniform(0.55, 0.95))
+    names = sorted("e"+str(n) for n in range(1, numEntities+1))
+    numRels = len(Classifier.relTypes) - 1                      # NONE is not voted for
+    for a in range(len(names)):
+        for b in range(a+1, min(a+window+1, len(names))):
+            if rng.random() > density:
+                continue
+            favourite = rng.randrange(numRels)
+            for classID in classIDs:
+                if rng.random() < 0.8:
+                    rp = favourite if rng.random() < 0.7 else rng.randrange(numRels)
+                    relTuple = Classifier.emptyTuple[:rp] + (1,) + Classifier.emptyTuple[rp+1:]
+                    document.setGlobalClassifier(names[a], names[b], relTuple, classID)
+    return final
+
+# Classifier.arcProbability against loopProbability for each weight formula on documents of params["sizes"] entities
+# voted on by params["classifiers"] classifiers, and whether both give exactly the same probabilities
+def benchProbability(params):
+    print "%8s %8s %8s %12s %12s %8s %6s" % ("entities", "arcs", "formula", "loop(s)", "array(s)", "speedup", "same")
+    for n in params["sizes"]:
+        for formula in "123456789":
+            (loopFinal, arrayFinal) = [randomEnsemble(n, window=params["window"], numClassifiers=params["classifiers"],
+                                                      seed=params["seed"]) for copy in range(2)]
+            for final in (loopFinal, arrayFinal):
+                final.ensemble.setWeightFormula('1', formula)
+            (old, oldTime) = timed(loopProbability, loopFinal)
+            (new, newTime) = timed(arrayFinal.arcProbability)
+            print "%8d %8d %8s %12.4f %12.4f %8.1f %6s" % (n, len(arrayFinal.ensemble.arcList), formula, oldTime, newTime,
+                  oldTime/max(newTime, 1e-9), old == new)
+    return
+
+# optimizer.main on a document with no arcs, on each path through it - every one must return no arcs
+def benchEmpty(params):
+    paths = [{}, {"backend": "pyomo"}, {"backend": "matrix"}, {"opt": "2"}, {"opt": "3"}, {"opt": "4"},
+             {"prune": True}, {"epsilon": 0.1}, {"fix": 0.9}, {"treewidth": params["treewidth"]}, {"warmstart": True},
+             {"decompose": True}, {"shard": params["shard"]}, {"formulation": "compact"}]
+    print "%-32s %12s %10s" % ("options", "time(s)", "status")
+    for options in paths:
+        options = dict({"backend": params["backend"], "solver": params["solver"]}, **options)
+        (result, resultTime) = timed(optimizer.main, {}, **options)
+        if result != {}:
+            raise ValueError("Arcs returned for an empty document with %s" % options)
+        print "%-32s %12.4f %10s" % (",".join("%s=%s" % (name, options[name]) for name in sorted(options)
+                                              if name != "solver")[:32], resultTime, optimizer.stats["status"])
+    return
+
+benchmarks = {"triads": benchTriads,
+              "build": benchBuild,
+              "formulation": benchFormulation,
+              "warmstart": benchWarmstart,
+              "documents": benchDocuments,
+              "prune": benchPrune,
+              "sparse": benchSparse,
+              "fix": benchFix,
+              "relax": benchRelax,
+              "search": benchSearch,
+              "treewidth": benchTreewidth,
+              "batch": benchBatch,
+              "schedule": benchSchedule,
+              "parallel": benchParallel,
+              "shard": benchShard,
+              "stitch": benchStitch,
+              "parse": benchParse,
+              "probability": benchProbability,
+              "empty": benchEmpty}
+
+def main(args):
+    bench = "triads"
+    params = {"sizes": [50, 100, 200, 400, 800], "window": 10, "seed": 0, "backend": "matrix", "solver": "cplex",
+              "docs": 20, "epsilon": 0.0, "batch": 10,
+              "treewidth": 4, "parallel": 4, "timings": None,
+              "shard": 50, "overlap": 10, "files": None, "classifiers": 5,
+              "opt": '1'}
+    for arg in args:
+        if arg[:6] == "bench=":
+            bench = arg[6:]
+        if arg[:6] == "sizes=":
+            params["sizes"] = [int(n) for n in arg[6:].split(",")]
+        if arg[:7] == "window=":
+            params["window"] = int(arg[7:])
+        if arg[:5] == "seed=":
+            params["seed"] = int(arg[5:])
+        if arg[:8] == "backend=":
+            params["backend"] = arg[8:]
+        if arg[:7] == "solver=":
+            params["solver"] = arg[7:]
+        if arg[:5] == "docs=":
+            params["docs"] = int(arg[5:])
+        if arg[:8] == "epsilon=":
+            params["epsilon"] = float(arg[8:])
+        if arg[:6] == "batch=":
+            params["batch"] = int(arg[6:])
+        if arg[:10] == "treewidth=":
+            params["treewidth"] = int(arg[10:])
+        if arg[:9] == "parallel=":
+            params["parallel"] = int(arg[9:])
+        if arg[:8] == "timings=":
+            params["timings"] = arg[8:]
+        if arg[:6] == "shard=":
+            params["shard"] = int(arg[6:])
+        if arg[:8] == "overlap=":
+            params["overlap"] = int(arg[8:])
+        if arg[:6] == "files=":
+            params["files"] = arg[6:]
+        if arg[:12] == "classifiers=":
+            params["classifiers"] = int(arg[12:])
+        if arg[:4] == "opt=":
+            params["opt"] = arg[4:]
+    if not bench in benchmarks:
+        print "Benchmark must be one of", ", ".join(sorted(benchmarks))
+        return False
+    benchmarks[bench](params)
+    return True
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -26,106 +26,121 @@ If you use this code, please cite our paper:
 
 from xml.etree.ElementTree import parse
 from bs4 import BeautifulSoup
+from lxml import etree                  # also the XML parser of BeautifulSoup
+import diskcache
+import os
 import os.path
 import math
 import numpy as np
 import pandas as pd
-  
-class Classifier:
-  
-  geid = 0                # global event identifier
-  gtid = 0                # global timex identifier
-  globalEvents = {}       # dictionary of global events indexed by sentence id and text - sid_text
-  globalArcs = {}         # dictionary of global arcs
-  finalArcs = {}          # dictionary of acrs passed to optimiser
-  eventInstances = {}     # mapping for event instance ids
-  timeMapping = {}        # mapping for time expressions
-  emptyTuple = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
-  noneTuple  = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)    # change last value to 1 if NONE is valid - for future use only
-  relTypes = ["BEFORE",
-              "AFTER",
-              "INCLUDES",
-              "IS_INCLUDED",
-              "DURING",
-              "DURING_INV",
-              "SIMULTANEOUS",
-              "IAFTER",
-              "IBEFORE",
-              "IDENTITY",
-              "BEGINS",
-              "ENDS",
-              "BEGUN_BY",
-              "ENDED_BY",
-              "NONE"]	  # list of relationship types
-  
-  invRelTypes = ["AFTER",       # inverse of BEFORE
-              "BEFORE",         # inverse of AFTER
-              "IS_INCLUDED",    # inverse of INCLUDES
-              "INCLUDES",       # inverse of IS_INCLUDED
-              "DURING_INV",     # inverse of DURING
-              "DURING",         # inverse of DURING_INV
-              "SIMULTANEOUS",   # inverse of SIMULTANEOUS
-              "IBEFORE",        # inverse of IAFTER
-              "IAFTER",         # inverse of IBEFORE
-              "IDENTITY",       # inverse of IDENTITY
-              "BEGUN_BY",       # inverse of BEGINS
-              "ENDED_BY",       # inverse of ENDS
-              "BEGINS",         # inverse of BEGUN_BY
-              "ENDS",           # inverse of ENDED_BY
-              "NONE"]	        # inverse of relationship types
 
-  probReltype = [0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]   # probabilities of each reltype occurring in Platinum will be read from file
-  bestClassifier = ()             # used for building new tml file - relevant for TaskABC
-  mostEvents = 0                  # holds number of events for best classifier
-  classifierList = []             # names of classifiers
-  classifierWeight = {}           # weights of each classifier, key is classID
-  weight = '1'                    # '1' = same weight across classifiers
-                                  # '2' = F1 score of each classifier
-                                  # '3' = Precision score of each classifier
-                                  # '4' = Recall score of each classifier
-                                  # '5' = new F1 score of each classifier
-                                  # '6' = new Precision score of each classifier
-                                  # '7' = new Recall score of each classifier
-                                  # '8' = a convex combination of precision and recall
-  convexifying = 0.5              # a convexifying coefficient for the combination of precision and recall (weight = '8')
-  weightFormula = '1'             # '1' = proportion of classifiers that detected arc
-                                  # '2' = proportion of ALL classifiers
-                                  # '3' = weights normalised to 1 and link excluded if below 0.5 threshold
-                                  # '4' = sum of logs of probabilities
-                                  # '5' = product of probabilities
-                                  # '6' = inverted loss function
-                                  # '7' = loss function
-
-  def __init__(self, classID, new):
-      self.classID = classID      # takes name of folder
-      self.arcs = {}              # dictionary of arcs for classifier
-      self.eInstances = []	  # event instance IDs
-      self.eInstRefs = []	  # event IDs corresponding to each event instance ID
-      self.etMaps = {}            # mapping from classifier ids to global ids
-      if new:                     # 'new' means starting to parse new file
-        self.nextFile()           # reset static variables
-      else:
-        self.addClassifier(classID) # add classifier to list of classifiers and default weight to 1
-        self.getScores(classID, Classifier.weight) # get scores for classifier
+# Reltypes of every classifier per arc, read as {arc : {classID : relTuple}} like the dictionary of dictionaries they
+# were once kept in. Each lookup builds the dictionary of one arc from its rows of Ensemble.votes
+class ArcVotes:
+
+  def __init__(self, ensemble):
+      self.ensemble = ensemble
+
+  def __len__(self):
+      return len(self.ensemble.arcList)
+
+  def __iter__(self):
+      return iter(self.ensemble.arcList)
+
+  def __contains__(self, arc):
+      return arc in self.ensemble.arcIndex
+
+  def __getitem__(self, arc):
+      ensemble = self.ensemble
+      rows = ensemble.votes[ensemble.arcIndex[arc], :len(ensemble.classifierList)].tolist()
+      return dict(zip(ensemble.classifierList, [tuple(row) for row in rows]))
+
+  def keys(self):
+      return list(self.ensemble.arcList)
+
+  def items(self):
+      return [(arc, self[arc]) for arc in self.ensemble.arcList]
+
+  def __repr__(self):
+      return repr(dict(self.items()))
+
+# State of one document across all its classifiers: the global ids of its events and times, the TLINKs of every
+# classifier per arc, and the classifiers with their weights. Every Classifier of the document is given the same
+# Ensemble, so documents with an Ensemble each can be parsed, weighted and mapped back at the same time
+class Ensemble:
+
+  def __init__(self):
+      self.geid = 0                 # global event identifier
+      self.gtid = 0                 # global timex identifier
+      self.globalEvents = {}        # dictionary of global events indexed by sentence id and text - sid_text
+      self.arcIndex = {}            # row of each global arc in votes
+      self.arcList = []             # global arc of each row of votes
+      self.votes = np.zeros((64, 4, len(Classifier.relTypes)), dtype=np.int8) # relTuple per arc and classifier, rows and columns
+                                    # beyond len(arcList) and len(classifierList) are spare
+      self.globalArcs = ArcVotes(self) # view of votes as a dictionary of global arcs
+      self.finalArcs = {}           # dictionary of acrs passed to optimiser
+      self.eventInstances = {}      # mapping for event instance ids
+      self.timeMapping = {}         # mapping for time expressions
+      self.bestClassifier = ()      # used for building new tml file - relevant for TaskABC
+      self.mostEvents = 0           # holds number of events for best classifier
+      self.classifierList = []      # names of classifiers
+      self.classifierWeight = {}    # weights of each classifier, key is classID
+      self.weight = '1'             # '1' = same weight across classifiers
+                                    # '2' = F1 score of each classifier
+                                    # '3' = Precision score of each classifier
+                                    # '4' = Recall score of each classifier
+                                    # '5' = new F1 score of each classifier
+                                    # '6' = new Precision score of each classifier
+                                    # '7' = new Recall score of each classifier
+                                    # '8' = a convex combination of precision and recall
+      self.convexifying = 0.5       # a convexifying coefficient for the combination of precision and recall (weight = '8')
+      self.weightFormula = '1'      # '1' = proportion of classifiers that detected arc
+                                    # '2' = proportion of ALL classifiers
+                                    # '3' = weights normalised to 1 and link excluded if below 0.5 threshold
+                                    # '4' = sum of logs of probabilities
+                                    # '5' = product of probabilities
+                                    # '6' = inverted loss function
+                                    # '7' = loss function
+      self.probReltype = [0.0]*15   # probabilities of each reltype occurring in Platinum will be read from file
+      reltypeFile = "reltypes.dat"
+      i = 0
+      for reltypeProbability in open(reltypeFile):
+        self.probReltype[i] = float(reltypeProbability.strip())
+        i += 1
+        if i == 14:
+          break
       return
 
-  def addClassifier(classID):
-    Classifier.classifierList.append(classID)
-    Classifier.setWeight(classID, 1.0)
+  def addClassifier(self, classID):
+    self.classifierList.append(classID)
+    self.setWeight(classID, 1.0)
+    self.growVotes(len(self.arcList), len(self.classifierList))
     return
-    
-  addClassifier = staticmethod(addClassifier)
 
-  def setWeightFormula(weight, weightFormula, convexifying = 0.1):
-    Classifier.weight = weight
-    Classifier.weightFormula = weightFormula
-    Classifier.convexifying = convexifying
+  def growVotes(self, numArcs, numClassifiers):          # at least numArcs rows and numClassifiers columns, doubling either
+    (rows, columns, numRels) = self.votes.shape
+    if numArcs <= rows and numClassifiers <= columns:
+      return
+    while rows < numArcs:
+      rows *= 2
+    while columns < numClassifiers:
+      columns *= 2
+    votes = np.zeros((rows, columns, numRels), dtype=np.int8)
+    votes[:self.votes.shape[0], :self.votes.shape[1]] = self.votes
+    self.votes = votes
+    return
+
+  def getVotes(self):                                     # relTuple per arc of arcList and classifier of classifierList
+    return self.votes[:len(self.arcList), :len(self.classifierList)]
+
+  def setWeightFormula(self, weight, weightFormula, convexifying = 0.1):
+    self.weight = weight
+    self.weightFormula = weightFormula
+    self.convexifying = convexifying
     # print "Setting weight to", weight, "with convexifying coefficient", convexifying
     return
-    
-  setWeightFormula = staticmethod(setWeightFormula)
 
-  def getScores(classID, weight):
+  def getScores(self, classID, weight):
       # print "Running getScores ... "
       inFile = "ClassifierScores.csv"    # open file containing scores for classifier
       try:
@@ -139,118 +154,188 @@ class Classifier:
             folder = ""
           if folder != "" :
             if weight == '2':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['F1_A'])
+              self.setWeight(classID, scores[scores.Folder==folder]['F1_A'])
             elif weight == '3':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['Precision_A'])
+              self.setWeight(classID, scores[scores.Folder==folder]['Precision_A'])
             elif weight == '4':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['Recall_A'])
+              self.setWeight(classID, scores[scores.Folder==folder]['Recall_A'])
             elif weight == '5':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['F1_B'])
+              self.setWeight(classID, scores[scores.Folder==folder]['F1_B'])
             elif weight == '6':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['Precision_B'])
+              self.setWeight(classID, scores[scores.Folder==folder]['Precision_B'])
             elif weight == '7':
-              Classifier.setWeight(classID, scores[scores.Folder==folder]['Recall_B'])
+              self.setWeight(classID, scores[scores.Folder==folder]['Recall_B'])
             elif weight == '8':
-              convex = Classifier.convexifying * scores[scores.Folder==folder]['Precision_B']
-              #print Classifier.convexifying * scores[scores.Folder==folder]['Precision_B']
-              #print (1.0 - Classifier.convexifying) * scores[scores.Folder==folder]['Recall_B']
-              convex += (1.0 - Classifier.convexifying) * scores[scores.Folder==folder]['Recall_B']
+              convex = self.convexifying * scores[scores.Folder==folder]['Precision_B']
+              #print self.convexifying * scores[scores.Folder==folder]['Precision_B']
+              #print (1.0 - self.convexifying) * scores[scores.Folder==folder]['Recall_B']
+              convex += (1.0 - self.convexifying) * scores[scores.Folder==folder]['Recall_B']
               #print "Actual convexified weight is", convex # where the first is 0-based index of the classifier
-              Classifier.setWeight(classID, convex)
+              self.setWeight(classID, convex)
             else:
               print "Unknown weight"
-            if (Classifier.weightFormula == '4' or Classifier.weightFormula == '5') and Classifier.badScore(Classifier.getWeight(classID)):
+            if (self.weightFormula == '4' or self.weightFormula == '5') and self.badScore(self.getWeight(classID)):
   #            print "Weight must be a probability between 0.5 and 1.0"
               raise TypeError("Weight must be a probability between 0.5 and 1.0")
           else :
             raise TypeError("Classifier folder must start with Test- or Training-")
         else:
-          Classifier.setWeight(classID, 1.0)
+          self.setWeight(classID, 1.0)
       except Exception as X:
         print X
         print "Error getting scores for classifier ", classID
         raise
       return
 
-  getScores = staticmethod(getScores)
-
   def badScore(weight):
-    return(weight <= 0.5 or weight >= 1.0)                                                                                     
+    return(weight <= 0.5 or weight >= 1.0)
 
   badScore = staticmethod(badScore)
 
-  def nextFile():                       # reset static variables
-      Classifier.geid = 0               #
-      Classifier.gtid = 0               #
-      Classifier.globalEvents = {}      #
-      Classifier.globalArcs = {}        #
-      Classifier.finalArcs = {}         # 
-      Classifier.eventInstances = {}    #
-      Classifier.timeMapping = {}       #
-      Classifier.bestClassifier = ()    #
-      Classifier.mostEvents = 0         #
-      Classifier.classifierList = []    #
-      Classifier.classifierWeight = {}  #
-      Classifier.weight = '1'           #
-      Classifier.weightFormula = '1'    #
-      reltypeFile = "reltypes.dat"      #
-      i = 0
-      for reltypeProbability in open(reltypeFile):
-        Classifier.probReltype[i] = float(reltypeProbability.strip())
-        i += 1
-        if i == 14:
-          break
-      return
-
-  nextFile = staticmethod(nextFile)
-
-  def getBestClassifier():
-      return Classifier.bestClassifier
+  def getBestClassifier(self):
+      return self.bestClassifier
 
-  getBestClassifier = staticmethod(getBestClassifier)
-  
-  def setBestClassifier(classID, filename, numEvents):
+  def setBestClassifier(self, classID, filename, numEvents):
       # For TaskABC, best classifier is one that identified most events
       # Not relevant for TaskC only because all classifiers start with same events
-      Classifier.bestClassifier = (classID, filename, numEvents)
-      Classifier.mostEvents = numEvents
+      self.bestClassifier = (classID, filename, numEvents)
+      self.mostEvents = numEvents
       return
 
-  setBestClassifier = staticmethod(setBestClassifier)
-  
-  def incGeid(gKey):                # increment global event id
-      Classifier.geid += 1
-      Classifier.globalEvents[gKey] = Classifier.geid
+  def incGeid(self, gKey):          # increment global event id
+      self.geid += 1
+      self.globalEvents[gKey] = self.geid
+      return
+
+  def incGtid(self, gKey):          # increment global tid
+      self.globalEvents[gKey] = self.gtid
+      self.gtid += 1
+      return
+
+  def getGlobalEvents(self, gKey):  # check if gKey is in global set of events/times
+      return self.globalEvents.get(gKey)
+
+  def getAllGlobalEvents(self):    # check if gKey is in global set of events/times
+      return self.globalEvents
+
+  def getGlobalArcs(self):          # get union of arcs across all classifiers
+      return self.globalArcs
+
+  def globalClassifier(self, globalID, globalRID):
+      return (globalID, globalRID) in self.arcIndex           # if TLINK already found by another classifier
+
+  def setGlobalClassifier(self, id, rid, relTuple, classID): # add this classifier's TLINK data to global classifier
+      arc = (id, rid)
+      if rid < id:
+        arc = Classifier.invArc(arc)                      # invert the arc
+        relTuple = Classifier.invRelTuple(relTuple)       # invert the reltype tuple
+      row = self.arcIndex.get(arc)
+      if row == None:                                     # if arc not already in global classifier
+        row = len(self.arcList)
+        self.growVotes(row + 1, len(self.classifierList))
+        self.arcIndex[arc] = row
+        self.arcList.append(arc)
+        self.votes[row, :len(self.classifierList)] = Classifier.noneTuple # add empty tuple for each of the classifiers
+      self.votes[row, self.classifierList.index(classID)] = relTuple # add relTuple for THIS classifier to arc
       return
 
-  incGeid = staticmethod(incGeid)
+  def addClassifierToArcs(self, classID):                 # adds empty tuples to each arc recored for this classifier
+    self.votes[:len(self.arcList), self.classifierList.index(classID)] = Classifier.noneTuple
+
+  def setFinalClassifier(self, arc, relTuple):
+      self.finalArcs[arc] = relTuple                      # set the relType in the new classifier
+      return
 
-  def incGtid(gKey):                # increment global tid
-      Classifier.globalEvents[gKey] = Classifier.gtid
-      Classifier.gtid += 1
+  def setFinalArcs(self, arcs, probs):                    # row n of the array probs is the relTuple of arcs[n]
+      self.finalArcs.update(zip(arcs, [tuple(row) for row in probs.tolist()]))
       return
 
-  incGtid = staticmethod(incGtid)
+  def getEventInstances(self, id):                        # get all event instances for global eid across all classifiers
+      return self.eventInstances.get(id)                  # format is {eid : {classifier : (eiid1, .. , eiidn)}}
+
+  def setEventInstances(self, id, clValues):              # set all event instances for global eid across all classifiers
+      self.eventInstances[id] = clValues
+
+  def getTimeMapping(self, id):                           # get global time id
+      return self.timeMapping.get(id)
 
-  def getGlobalEvents(gKey):        # check if gKey is in global set of events/times
-      return Classifier.globalEvents.get(gKey)
+  def setTimeMapping(self, id, clValues):                 # set global time id
+      self.timeMapping[id] = clValues
 
-  getGlobalEvents = staticmethod(getGlobalEvents)
+  def getWeight(self, classID):                           # get weight for classifier
+      return float(self.classifierWeight[classID])
+
+  def setWeight(self, classID, weight):                   # set weight for classifier
+      self.classifierWeight[classID] = weight
+      return
+
+class Classifier:
+  
+  emptyTuple = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+  noneTuple  = (0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)    # change last value to 1 if NONE is valid - for future use only
+  relTypes = ["BEFORE",
+              "AFTER",
+              "INCLUDES",
+              "IS_INCLUDED",
+              "DURING",
+              "DURING_INV",
+              "SIMULTANEOUS",
+              "IAFTER",
+              "IBEFORE",
+              "IDENTITY",
+              "BEGINS",
+              "ENDS",
+              "BEGUN_BY",
+              "ENDED_BY",
+              "NONE"]	  # list of relationship types
   
-  def getAllGlobalEvents():        # check if gKey is in global set of events/times
-      return Classifier.globalEvents
+  invRelTypes = ["AFTER",       # inverse of BEFORE
+              "BEFORE",         # inverse of AFTER
+              "IS_INCLUDED",    # inverse of INCLUDES
+              "INCLUDES",       # inverse of IS_INCLUDED
+              "DURING_INV",     # inverse of DURING
+              "DURING",         # inverse of DURING_INV
+              "SIMULTANEOUS",   # inverse of SIMULTANEOUS
+              "IBEFORE",        # inverse of IAFTER
+              "IAFTER",         # inverse of IBEFORE
+              "IDENTITY",       # inverse of IDENTITY
+              "BEGUN_BY",       # inverse of BEGINS
+              "ENDED_BY",       # inverse of ENDS
+              "BEGINS",         # inverse of BEGUN_BY
+              "ENDS",           # inverse of ENDED_BY
+              "NONE"]	        # inverse of relationship types
 
-  getAllGlobalEvents = staticmethod(getAllGlobalEvents)
+  parser = 'bs4'                  # 'bs4' = BeautifulSoup tree of the whole tml file
+                                  # 'lxml' = one streaming pass of lxml iterparse over the tml file, see readLxml
+  parseCache = None               # directory keeping what readSoup or readLxml took from each tml file - None for none
+  parseCacheSize = 100000         # number of files kept in the parse cache - the least recently used go first
+  tlinkAttributes = ('relType', 'timeID', 'relatedToTime', 'eventInstanceID', 'relatedToEventInstance')   # of each TLINK read
+  readVersion = 1                 # bumped whenever readSoup and readLxml change, so older parse cache entries are not used
 
-  def getGlobalArcs():              # get union of arcs across all classifiers
-      return Classifier.globalArcs
+  def __init__(self, classID, new, ensemble):
+      self.classID = classID      # takes name of folder
+      self.arcs = {}              # dictionary of arcs for classifier
+      self.eInstances = []	  # event instance IDs
+      self.eInstRefs = []	  # event IDs corresponding to each event instance ID
+      self.etMaps = {}            # mapping from classifier ids to global ids
+      self.ensemble = ensemble    # state of the document shared by all its classifiers - a new Ensemble per file
+      if not new:
+        self.ensemble.addClassifier(classID) # add classifier to list of classifiers and default weight to 1
+        self.ensemble.getScores(classID, self.ensemble.weight) # get scores for classifier
+      return
+
+  def setParser(parser):
+    Classifier.parser = parser
+    return
 
-  getGlobalArcs = staticmethod(getGlobalArcs)
+  setParser = staticmethod(setParser)
 
-  def globalClassifier(globalID, globalRID):
-      return (globalID, globalRID) in Classifier.globalArcs   # if TLINK already found by another classifier
+  def setParseCache(directory, maxEntries=100000):
+    Classifier.parseCache = directory
+    Classifier.parseCacheSize = maxEntries
+    return
 
-  globalClassifier = staticmethod(globalClassifier)
+  setParseCache = staticmethod(setParseCache)
 
   def invArc(arc):
     left = arc[0]
@@ -268,141 +353,73 @@ class Classifier:
 
   invRelTuple = staticmethod(invRelTuple)
 
-  def setGlobalClassifier(id, rid, relTuple, classID):    # add this classifier's TLINK data to global classifier
-      arc = (id, rid)
-      clValues = {}
-      if rid < id:
-        arc = Classifier.invArc(arc)                      # invert the arc
-        relTuple = Classifier.invRelTuple(relTuple)       # invert the reltype tuple
-      if arc in Classifier.globalArcs:                    # if arc already in global classifier
-        clValues = Classifier.globalArcs[arc]             
-        for cl in Classifier.classifierList:
-          if not cl in clValues:                          # make sure there is an entry for each of the classifiers
-            clValues[cl] = Classifier.noneTuple
-      else:                                               # otherwise
-        for cl in Classifier.classifierList:              # add empty tuple for each of the classifiers
-          clValues[cl] = Classifier.noneTuple
-      clValues[classID] = relTuple                        # add relTuple for THIS classifier to arc
-      Classifier.globalArcs[arc] = clValues               # set the relType in the new classifier
-      return
-
-  setGlobalClassifier = staticmethod(setGlobalClassifier)
-
-  def addClassifierToArcs(classID):                       # adds empty tuples to each arc recored for this classifier
-    for arc in Classifier.globalArcs:
-      clValues = Classifier.globalArcs[arc]
-      clValues[classID] = Classifier.noneTuple
-
-  addClassifierToArcs = staticmethod(addClassifierToArcs)
-
-  def setFinalClassifier(arc, relTuple):
-      Classifier.finalArcs[arc] = relTuple                # set the relType in the new classifier
-      return
-
-  setFinalClassifier = staticmethod(setFinalClassifier)
-
-  def getEventInstances(id):                              # get all event instances for global eid across all classifiers
-      return Classifier.eventInstances.get(id)            # format is {eid : {classifier : (eiid1, .. , eiidn)}}
-      
-  getEventInstances = staticmethod(getEventInstances)      
-
-  def setEventInstances(id, clValues):                    # set all event instances for global eid across all classifiers
-      Classifier.eventInstances[id] = clValues
-      
-  setEventInstances = staticmethod(setEventInstances)      
-
-  def getTimeMapping(id):                                 # get global time id
-      return Classifier.timeMapping.get(id) 
-      
-  getTimeMapping = staticmethod(getTimeMapping)      
-
-  def setTimeMapping(id, clValues):                       # set global time id
-      Classifier.timeMapping[id] = clValues
-      
-  setTimeMapping = staticmethod(setTimeMapping)      
-
   def findGlobalKey(self, gKey, id):            # check whether the event/timex3 was already found by a previous classifier
-    if self.getGlobalEvents(gKey) == None:      # if event/timex3 not already found
+    if self.ensemble.getGlobalEvents(gKey) == None: # if event/timex3 not already found
       if id[0] == "e":
-        self.incGeid(gKey)                      # increment global event id number
+        self.ensemble.incGeid(gKey)             # increment global event id number
       else:
-        self.incGtid(gKey)
-    globalID = self.getGlobalEvents(gKey)       # find global ID corresponding to event/timex3
+        self.ensemble.incGtid(gKey)
+    globalID = self.ensemble.getGlobalEvents(gKey) # find global ID corresponding to event/timex3
     self.etMaps[id] = id[0]+str(globalID)       # map the classifier's event/time id to the global event/time id
     return
   
-  def parseEvent(self, root):                   #
+  def parseEvent(self, stext, events):          # full text of sentence and (eid, text) of its events, see readSoup
     sStart = 0                                  # position to start search for text in sentence
-    stext = root.get_text()                     # full text of sentence
-    for event in root.find_all("EVENT"):        # for each event in the sentence
-      eid = event.get('eid')		        # get event_id
-      eclass = event.get('class')		# get event_class
-      etext = event.text.strip()		# get event text
+    for (eid, etext) in events:                 # for each event in the sentence
       epos = stext.find(etext, sStart)          # find start position of text in sentence
       sStart = epos+1                           # next search will start from current position + 1
       gKey = str(epos)+"_"+etext                # unique key is sentence number + position in sentence + event text
       self.findGlobalKey(gKey, eid)             # set global id for classifier's event id
     return
       
-  def parseTime(self, root):                    #
+  def parseTime(self, stext, timexes):         # full text and (tid, text) of its TIMEX3 tags
     sStart = 0                                  #
-    stext = root.get_text()                     #
-    for timex in root.find_all("TIMEX3"):       #
-      tid = timex.get('tid')			# get time_id
-      tType = timex.get('type')			# get time type
-      tValue = timex.get('value')		# get time value
-      ttext = timex.text.strip()                # get text of time
+    for (tid, ttext) in timexes:                #
       epos = stext.find(ttext, sStart)          #
       sStart = epos+1                           #
       gKey = str(epos)+"_"+ttext                #
       self.findGlobalKey(gKey, tid)             # global id is sentence number + position in sentence + time text
       gtid = self.etMaps[tid]                   #
-      if self.getTimeMapping(gtid) == None:     # append to global time dictionary
+      if self.ensemble.getTimeMapping(gtid) == None: # append to global time dictionary
         clValues = {}                           # used for reverse mapping from global TLINKs to classifier TLINKs
         clValues[self.classID] = [tid]          #
-        self.setTimeMapping(gtid, clValues)     #
+        self.ensemble.setTimeMapping(gtid, clValues) #
       else:                         
-        clValues = self.getTimeMapping(gtid)    #
+        clValues = self.ensemble.getTimeMapping(gtid) #
         tids = clValues.get(self.classID)       #
         if tids == None:                        #
           tids = [tid]                          #
         else:
           tids.append(tid)                      #
         clValues[self.classID] = tids           #
-        self.setTimeMapping(gtid, clValues)     #
+        self.ensemble.setTimeMapping(gtid, clValues) #
     return
 
-  def parseMakeInstance(self, root):
-    for makeinst in root.find_all('MAKEINSTANCE'):
-      eiid = makeinst.get('eiid')		# get eiid
-      eid = makeinst.get('eventID')		# get eventID
+  def parseMakeInstance(self, instances):      # (eiid, eventID) of each MAKEINSTANCE
+    for (eiid, eid) in instances:
       geid = self.etMaps[eid]
-      if self.getEventInstances(geid) == None:  # append to global event instance dictionary
+      if self.ensemble.getEventInstances(geid) == None: # append to global event instance dictionary
         clValues = {}                           # used for reverse mapping from global TLINKs to classifier TLINKs
         clValues[self.classID] = [eiid]         # set {classifier : [eiid]}
-        self.setEventInstances(geid, clValues)  # set {geid : {classifier : [eiid]}}
+        self.ensemble.setEventInstances(geid, clValues) # set {geid : {classifier : [eiid]}}
       else:
-        clValues = self.getEventInstances(geid)
+        clValues = self.ensemble.getEventInstances(geid)
         eiids = clValues.get(self.classID)
         if eiids == None:
           eiids = [eiid]
         else:
           eiids.append(eiid)                    # [eiid1, eiid2]
         clValues[self.classID] = eiids          # set {classifier : [eiid1, eiid2]}
-        self.setEventInstances(geid, clValues)  # set {geid : {classifier : [eiid1, eiid2]}}
+        self.ensemble.setEventInstances(geid, clValues) # set {geid : {classifier : [eiid1, eiid2]}}
       if not eiid in self.eInstances:           # set mapping from event instance id to event id
         self.eInstances.append(eiid)
         self.eInstRefs.append(eid)		# reference back to event ID
-#    print Classifier.eventInstances
+#    print self.ensemble.eventInstances
     return
 
-  def parseTlink(self,tlink):
-      lid 	= tlink.get('lid')			# get link_id
-      relType 	= tlink.get('relType')			# get relationship type
-      timeID 	= tlink.get('timeID')			# get timeID
-      relTime 	= tlink.get('relatedToTime')		# get related to time
-      eiid	= tlink.get('eventInstanceID')		# get event instance id
-      relEInst 	= tlink.get('relatedToEventInstance')	# get related to event instance
+  def parseTlink(self,tlink):                  # values of tlinkAttributes of the TLINK
+      (relType, timeID, relTime, eiid, relEInst) = tlink    # relationship type, timeID, related to time,
+                                                            # event instance id, related to event instance
       rp	= self.relTypes.index(relType)		# get position of relType in relTypes
       if timeID != None:                                # TLINK is Time-x
         ID = timeID
@@ -410,7 +427,7 @@ class Classifier:
       else:                                             # TLINK is Event-x
         ID = self.eInstRefs[self.eInstances.index(eiid)] # get eid that eiid maps to
         geid = self.etMaps[ID]
-        eInstNum = Classifier.eventInstances[geid][self.classID].index(eiid)
+        eInstNum = self.ensemble.eventInstances[geid][self.classID].index(eiid)
         if eInstNum == 0:                               # if first event instance, set global id to event id
           globalID = geid
         else:                                           # else set global id to event id + number
@@ -422,28 +439,92 @@ class Classifier:
       globalRID = self.etMaps[rID]                      # get corresponding global ID
       relTuple = self.emptyTuple[:rp] + (1,) + self.emptyTuple[rp+1:] # put 1 in relevant position for relType
       self.arcs[(globalID, globalRID)] = relTuple
-      self.setGlobalClassifier(globalID, globalRID, relTuple, self.classID)
+      self.ensemble.setGlobalClassifier(globalID, globalRID, relTuple, self.classID)
       return
 
+  # Everything parseTml takes from a tml file: the full text of DCT with the (tid, text) of its TIMEX3 tags, the full
+  # text of TEXT with the (eid, text) of its EVENT tags and the (tid, text) of its TIMEX3 tags, the (eiid, eventID)
+  # of each MAKEINSTANCE and the tlinkAttributes of each TLINK, all in document order
+  def readSoup(filename):
+      tree = BeautifulSoup(open(filename), "xml")
+      dct = tree.find('DCT')
+      fullText = tree.find('TEXT')
+      return {'dct': (dct.get_text(), [(timex.get('tid'), timex.text.strip()) for timex in dct.find_all("TIMEX3")]),
+              'events': (fullText.get_text(), [(event.get('eid'), event.text.strip())
+                                               for event in fullText.find_all("EVENT")]),
+              'times': (fullText.get_text(), [(timex.get('tid'), timex.text.strip())
+                                              for timex in fullText.find_all("TIMEX3")]),
+              'instances': [(makeinst.get('eiid'), makeinst.get('eventID')) for makeinst in tree.find_all('MAKEINSTANCE')],
+              'tlinks': [tuple(tlink.get(name) for name in Classifier.tlinkAttributes)
+                         for tlink in tree.find_all('TLINK')]}
+
+  readSoup = staticmethod(readSoup)
+
+  # Same as readSoup in one pass of iterparse, which stops at the end of DCT, TEXT, MAKEINSTANCE and TLINK only.
+  # Each is dropped from the tree once read, so the tree never holds more than the tag being read
+  def readLxml(filename):
+      document = {'instances': [], 'tlinks': []}
+      for (event, element) in etree.iterparse(filename, events=('end',), tag=('DCT', 'TEXT', 'MAKEINSTANCE', 'TLINK'),
+                                              remove_comments=True):
+        if element.tag == 'MAKEINSTANCE':
+          document['instances'].append((element.get('eiid'), element.get('eventID')))
+        elif element.tag == 'TLINK':
+          document['tlinks'].append(tuple(element.get(name) for name in Classifier.tlinkAttributes))
+        elif element.tag == 'DCT' and not 'dct' in document:
+          document['dct'] = Classifier.readText(element, 'TIMEX3', 'tid')
+        elif element.tag == 'TEXT' and not 'events' in document:
+          document['events'] = Classifier.readText(element, 'EVENT', 'eid')
+          document['times'] = Classifier.readText(element, 'TIMEX3', 'tid')
+        element.clear()
+        while element.getprevious() is not None:
+          del element.getparent()[0]
+      return document
+
+  readLxml = staticmethod(readLxml)
+
+  def readText(element, tag, idName):          # full text of element and (id, text) of each tag in it
+      return ("".join(element.itertext()), [(tagged.get(idName), "".join(tagged.itertext()).strip())
+                                            for tagged in element.iter(tag)])
+
+  readText = staticmethod(readText)
+
+  # What readSoup or readLxml take from the file, pickled in the parse cache under the path, size and modification
+  # time of the file, so a file read before is only parsed again once it changes. Both readers give the same
+  # records, so they share the cache
+  def readTml(filename):
+      if Classifier.parseCache != None:
+        stat = os.stat(filename)
+        key = diskcache.Key_init(Classifier.readVersion, os.path.abspath(filename), stat.st_size, stat.st_mtime)
+        document = diskcache.Load(Classifier.parseCache, key)
+        if document != None:
+          return document
+      if Classifier.parser == 'lxml':
+        document = Classifier.readLxml(filename)            # one streaming pass over the file
+      else:
+        document = Classifier.readSoup(filename)            # parse each file
+      if Classifier.parseCache != None:
+        diskcache.Store(Classifier.parseCache, key, document, Classifier.parseCacheSize)
+      return document
+
+  readTml = staticmethod(readTml)
+
   def parseTml(self, filename):
     try:
-      tree = BeautifulSoup(open(filename), "xml")	    # parse each file 
-      dct = tree.find('DCT')                                # document creation time
-      self.parseTime(dct)
+      document = self.readTml(filename)                     # records of the file, see readSoup
+      self.parseTime(*document['dct'])                      # document creation time
 
-      fullText = tree.find('TEXT')                          # parse each EVENT in the text
-      self.parseEvent(fullText)
+      self.parseEvent(*document['events'])                  # parse each EVENT in the text
 
-      self.parseTime(fullText)                              # parse each TIMEX3 tag in the text
+      self.parseTime(*document['times'])                    # parse each TIMEX3 tag in the text
       numEvents = len(self.etMaps)                          # number of events found in classifier
-      if numEvents > Classifier.mostEvents:                 # best classifier is one with most events detected - used as baseline for new tml file
-        self.setBestClassifier(self.classID, filename, numEvents)
+      if numEvents > self.ensemble.mostEvents:              # best classifier is one with most events detected - used as baseline for new tml file
+        self.ensemble.setBestClassifier(self.classID, filename, numEvents)
         
-      self.parseMakeInstance(tree)                          # parse each MAKEINSTANCE tag in the tml file
+      self.parseMakeInstance(document['instances'])         # parse each MAKEINSTANCE tag in the tml file
 
-      self.addClassifierToArcs(self.classID)                # add this classifier to every existing arc
+      self.ensemble.addClassifierToArcs(self.classID)       # add this classifier to every existing arc
       
-      for tlink in tree.find_all('TLINK'):                  # parse each TLINK tag in the tml file
+      for tlink in document['tlinks']:                      # parse each TLINK tag in the tml file
         self.parseTlink(tlink)
       
     except Exception as X:
@@ -452,132 +533,97 @@ class Classifier:
     return
 
   # Now assign probabilities to each of the relTypes in the final classifier
+  # Each formula works on the votes of all arcs at once, adding up one classifier at a time in the order of
+  # classifierList, so every probability is the same float as when arcs and relTypes were looped over one by one
   def arcProbability(self):
     try:
+      document = self.ensemble
+      votes = document.getVotes()                         # relTuple per arc and classifier
+      (numArcs, numRels) = (votes.shape[0], votes.shape[2])
       # Next code applies product of probabilities, or sum of logs of probabilities
-      if Classifier.weightFormula == '4' or Classifier.weightFormula == '5':
-        for arc in Classifier.globalArcs:                 # for each TLINK in the final classifier
-          relTuple = ()
-          for i in range(15):
-            if Classifier.weightFormula == '4':           # use sum of logs
-              prob = 0
-            else:                                         # use product of probabilities
-              prob = 1
-            assignedByClassifier = False                  # relType was not assigned by any classifier - possible future use
-            for cl in Classifier.classifierList:
-                if Classifier.globalArcs[arc][cl][i] == 1:
-                    assignedByClassifier = True           # if at least one classifier assigns the relType, set to True
-                    if Classifier.weightFormula == '4':   # if '4' use sum of logs formula
-                      prob += math.log1p(Classifier.getWeight(cl))
-                    else:                                 # if '5' use product formula
-                      prob *= Classifier.getWeight(cl)
-                else:
-                  if Classifier.weightFormula == '4':
-                    prob += math.log1p(1-Classifier.getWeight(cl))
-                  else:
-                    prob *= 1-Classifier.getWeight(cl)
-#            if assignedByClassifier == False:              # if no classifier assigned the reltype, weigh according to popularity of reltype
-#              prob *= Classifier.probReltype[i]            # might implement this later
-            relTuple += (prob,)            
-          self.setFinalClassifier(arc, relTuple)
-        return Classifier.finalArcs
+      if document.weightFormula == '4' or document.weightFormula == '5':
+        if document.weightFormula == '4':                 # use sum of logs
+          prob = np.zeros((numArcs, numRels))
+        else:                                             # use product of probabilities
+          prob = np.ones((numArcs, numRels))
+        for (c, cl) in enumerate(document.classifierList):
+          weight = document.getWeight(cl)
+          assigned = votes[:, c] == 1                     # relTypes the classifier assigns to each arc
+          if document.weightFormula == '4':               # if '4' use sum of logs formula
+            prob = prob + np.where(assigned, math.log1p(weight), math.log1p(1-weight))
+          else:                                           # if '5' use product formula
+            prob = prob * np.where(assigned, weight, 1-weight)
+        document.setFinalArcs(document.arcList, prob)
+        return document.finalArcs
 
       # If formula is '3' or '6' or '7', need to normalise sum of weights to 1
-      if Classifier.weightFormula == '3' or Classifier.weightFormula >= '6':    
+      if document.weightFormula == '3' or document.weightFormula >= '6':
         totalWeight = float(0)
-        for cl in Classifier.classifierList:
-          totalWeight += Classifier.getWeight(cl)               # get total weight of all classifiers
-        for cl in Classifier.classifierList:
-          Classifier.setWeight(cl, Classifier.getWeight(cl)/totalWeight) # divide each classifier weight by total weight to normalise sum to 1
+        for cl in document.classifierList:
+          totalWeight += document.getWeight(cl)           # get total weight of all classifiers
+        for cl in document.classifierList:
+          document.setWeight(cl, document.getWeight(cl)/totalWeight) # divide each classifier weight by total weight to normalise sum to 1
 
       # Next code applies LOSS functions
-      if Classifier.weightFormula >= '6':
-        for arc in Classifier.globalArcs:                 # for each TLINK in the final classifier
-          relTuple = ()
-          for i in range(15):
-            prob = 0
-            for cl in Classifier.classifierList:
-                if Classifier.globalArcs[arc][cl][i] != 1:  # if prediction doesn't match
-                   t = 1
-                else:
-                   t = 0
-                if Classifier.weightFormula == '6':
-                   prob += t*Classifier.getWeight(cl)       # add classifier's weight to total probability
-                elif Classifier.weightFormula == '7':
-                   prob += t*Classifier.getWeight(cl)     # hinge loss   
-                elif Classifier.weightFormula == '8':
-                   prob += t*Classifier.getWeight(cl)*Classifier.getWeight(cl)   # square loss   
-                elif Classifier.weightFormula == '9':
-                   prob += t*math.log1p(Classifier.getWeight(cl)) + t*math.log1p(1-Classifier.getWeight(cl))   # log loss   
-            if Classifier.weightFormula == '6':
-                prob = 1 - prob                           # invert the loss
-                prob *= Classifier.probReltype[i]         # multiply total by prior probability of reltype
-            else:
-                prob *= (Classifier.probReltype[i]-1)     # multiply by probability of NOT being reltype and negate for Maximise objective function
-            relTuple += (prob,)            
-          self.setFinalClassifier(arc, relTuple)
-        return Classifier.finalArcs
-
-          
-      for arc in Classifier.globalArcs:                   # for each TLINK in the final classifier
-        if Classifier.weightFormula != '1':
-          numClassifiers = float(len(Classifier.classifierList))  # total number of classifiers
-        else:
-          numClassifiers = float(0)                       # increment for each classifier that detects the arc
-        relTuple = self.emptyTuple
-        for cl in Classifier.classifierList:
-          if cl in Classifier.globalArcs[arc]:            # if classifier has identified the arc
-            if Classifier.weightFormula == '1' and sum(Classifier.globalArcs[arc][cl]) >= 1: 
-              numClassifiers += 1                         # if weight is proportion of classifiers that identified arc, increment number
-            relTuple = self.addRelTuple(relTuple, Classifier.globalArcs[arc][cl],cl) # add this classifier's probability to the existing tuple of probabilities
+      if document.weightFormula >= '6':
+        prob = np.zeros((numArcs, numRels))
+        for (c, cl) in enumerate(document.classifierList):
+          weight = document.getWeight(cl)
+          if document.weightFormula == '6':
+            loss = weight                                 # add classifier's weight to total probability
+          elif document.weightFormula == '7':
+            loss = weight                                 # hinge loss
+          elif document.weightFormula == '8':
+            loss = weight*weight                          # square loss
           else:
-            relTuple = self.addRelTuple(relTuple, self.noneTuple, cl) # redundant unless we introduce NONE as valid reltype
-        if Classifier.weightFormula == '1':               # if weight is number of classifiers that identified arc, need to divide probability by this number
-          newTuple = ()
-          for prob in relTuple:                           # for each relType
-            newTuple += (prob/numClassifiers,)            # set to proportion of classifiers that assigned that relType
-#          if numClassifiers > 1:                          # temporary
-          self.setFinalClassifier(arc, newTuple)
-        elif Classifier.weightFormula == '3':
-          if sum(relTuple) >= 0.5:                        # arc is only included if total probability greater than threshold (default 0.5)
-            self.setFinalClassifier(arc, relTuple)
+            loss = math.log1p(weight) + math.log1p(1-weight) # log loss
+          prob = prob + np.where(votes[:, c] != 1, loss, 0.0) # where prediction doesn't match
+        prior = np.array(document.probReltype[:numRels])
+        if document.weightFormula == '6':
+          prob = (1 - prob) * prior                       # invert the loss and multiply by prior probability of reltype
         else:
-            self.setFinalClassifier(arc, relTuple)
+          prob = prob * (prior - 1)                       # multiply by probability of NOT being reltype and negate for Maximise objective function
+        document.setFinalArcs(document.arcList, prob)
+        return document.finalArcs
+
+      prob = np.zeros((numArcs, numRels))
+      for (c, cl) in enumerate(document.classifierList):
+        prob = prob + document.getWeight(cl)*votes[:, c]  # add this classifier's probability to the existing probabilities
+      if document.weightFormula == '1':                   # if weight is number of classifiers that identified arc, need to divide probability by this number
+        numClassifiers = (votes.sum(axis=2) >= 1).sum(axis=1) # classifiers that detect each arc
+        document.setFinalArcs(document.arcList, prob / numClassifiers[:, np.newaxis])
+      elif document.weightFormula == '3':
+        total = np.zeros(numArcs)
+        for i in range(numRels):
+          total = total + prob[:, i]                      # summed in relType order, as sum of a tuple
+        keep = total >= 0.5                               # arc is only included if total probability greater than threshold (default 0.5)
+        document.setFinalArcs([arc for (arc, kept) in zip(document.arcList, keep) if kept], prob[keep])
+      else:
+        document.setFinalArcs(document.arcList, prob)
     except Exception as X:
       print "Error assigning probabilities to relTypes "
       raise
-    return Classifier.finalArcs
+    return self.ensemble.finalArcs
 
   def addRelTuple(self, relTuple, addTuple, classID):   # add this classifier's probabilities to the existing reltype tuple
     i = 0
     newTuple = ()
     for prob in relTuple:
-      newTuple += (relTuple[i] + Classifier.getWeight(classID)*int(addTuple[i]),) # apply classifier weight to new tuple
+      newTuple += (relTuple[i] + self.ensemble.getWeight(classID)*int(addTuple[i]),) # apply classifier weight to new tuple
       i += 1
     return newTuple
 
-  def getWeight(classID):                               # get weight for classifier
-    return float(Classifier.classifierWeight[classID])
-
-  getWeight = staticmethod(getWeight)
-
-  def setWeight(classID, weight):                       # set weight for classifier
-    Classifier.classifierWeight[classID] = weight
-    return
-
-  setWeight = staticmethod(setWeight)
-
   def outputClassifier(self):
     if not os.path.isdir("RESULTS"):                    # create RESULTS directory if it doesn't exist
       os.makedirs("RESULTS")
-    (cl, inFile, num) = self.getBestClassifier()        # base the final tml filae on the best classifier - the one with the most events identified
+    (cl, inFile, num) = self.ensemble.getBestClassifier() # base the final tml filae on the best classifier - the one with the most events identified
 #    print "Best classifier: ", inFile, "   Number of events: ", num
     pos = inFile.rfind('/')
     outFile = "RESULTS/"+inFile[pos+1:]                 # set outFile name to same as inFile name in directory RESULTS
 #    print outFile
     return (cl, inFile, outFile)
 
-  def mapResults(self, result):
+  def mapResults(self, result, confidence=None):     # confidence of each reltype per arc, e.g. optimizer.confidence
     try:
       (cl, inFile, outFile) = self.outputClassifier()
       tree = BeautifulSoup(open(inFile), "xml")		  # open the final tml file
@@ -621,6 +667,8 @@ class Classifier:
             newTlink["relatedToEventInstance"] = relEiid
           if relTime != "":
             newTlink["relatedToTime"] = relTime
+          if confidence != None and arc in confidence:
+            newTlink["confidence"] = "%.4f" % confidence[arc][result[arc].index(1)]
           timeML.append(newTlink)                           # add the TLINK to the file
           linkNum += 1                                      # increment the TLINK number
   #    outputText = tree.prettify()                         # get new TimeML file ready for output
@@ -635,7 +683,7 @@ class Classifier:
 
   def mapEventInstanceID(self, cl, id):                   # map global id back to eiid
     parts  = id.split('_')                                # if more than one eiid for event, global arc was set to geid_n
-    clList = self.getEventInstances(parts[0])             # where geid is global event id and n is incremented by 1 for each eiid found
+    clList = self.ensemble.getEventInstances(parts[0])    # where geid is global event id and n is incremented by 1 for each eiid found
     if clList != None:
       eiList = clList.get(cl)                             # gets eiid list for this event and this classifier
       if eiList != None:
@@ -646,7 +694,7 @@ class Classifier:
     return None
 
   def mapTimeID(self, cl, id):                            # map global time id back to classifier time id
-    clList = self.getTimeMapping(id)
+    clList = self.ensemble.getTimeMapping(id)
     if clList != None:
       tidList = clList.get(cl)
       if tidList != None:
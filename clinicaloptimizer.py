@@ -25,6 +25,9 @@ If you use this code, please cite our paper:
 from pyomo.environ import *
 from pyomo.opt import SolverFactory
 import pandas as pd
+import arcgraph
+import consistency
+import ipmatrix
 
 ##############################################################################################################################################
 ## 
@@ -127,21 +130,7 @@ def Arcs_init(df):
 
 # Add connected tri-graphs to model
 def Connected_Arcs_init(df):
-    retval = []
-    for arc1, p in df.iterrows() :
-        i = arc1[0]
-        ij = arc1[1]
-        for arc2, p in df.iterrows() :
-            if arc1 != arc2: 
-                jk = arc2[0]
-                k = arc2[1]
-                if ij == jk:
-                    ik = (i,k) 
-                    if ik in df.index:
-                        tuple = ()   
-                        tuple += (i,) + (ij,) + (k,) 
-                        retval +=(tuple,)
-    return retval                 
+    return arcgraph.Triads_init(df.index)
 
 # Loads 2-d arc/reltype weights into model
 def Rels_init(model, left, right, i):
@@ -174,19 +163,32 @@ def Transitivity_rule(model, i , j, k, arc1IntType, arc2IntType):
     numConstraints += 1
     return model.x[arc1,arc1RT] + model.x[arc2,arc2RT] - sum(model.x[arc3,model.mapTuple[arc3RT[j]]] for j in range(len(arc3RT))) <=1            
 
+# Transitivity rules aggregated over the reltypes of arc (j,k) that give the same closure - see ipmatrix.Groups_init
+compactrelations = ipmatrix.Groups_init(reltypes, compositerelations)
+
+# Composition templates of the matrix model used by the in-process solvers
+templates = {'full': ipmatrix.Templates_init(reltypes, maptuple, compositerelations, 'full'),
+             'compact': ipmatrix.Templates_init(reltypes, maptuple, compositerelations, 'compact')}
+
+# Closure masks of the pairs of reltype indices, for the dynamic programming of consistency.Eliminate_init
+masks = consistency.Mask_table(consistency.Closure_table(reltypes, maptuple, compositerelations), len(reltypes))
+
+# Constraint - transitive closure rules, one per group of compactrelations
+def CompactTransitivity_rule(model, i, j, k, group):
+    global numConstraints
+    arc1 = (i,j)
+    arc2 = (j,k)
+    arc3 = (i,k)
+    (arc1IntType, arc2IntTypes, arc3RT) = compactrelations[group]
+    numConstraints += 1
+    return model.x[arc1,model.mapTuple[arc1IntType]] + sum(model.x[arc2,model.mapTuple[r]] for r in arc2IntTypes) - sum(model.x[arc3,model.mapTuple[r]] for r in arc3RT) <= 1
+
 #############################################################################################################    
 #
-# Optimise Final Classifier using pyomo model
+# Build and solve pyomo model for Final Classifier
 #
-#v = {}              # contains dictionary passed from pre-processor
-df = pd.DataFrame(columns=('source', 'target', 'percent'))
-numConstraints = 0
-def main(df_in):
-    global df
-    global numConstraints
-    numConstraints = 0
-    df = df_in
-    opt = SolverFactory('cplex')
+def Model_main(formulation, solver):
+    opt = SolverFactory(solver)
     model = ConcreteModel()
     model.relTypes = Set(initialize=reltypes, ordered=True);
     model.mapTuple = Param(model.relTypes, initialize=maptuple)
@@ -200,15 +202,63 @@ def main(df_in):
     model.xProb = Param(model.Arcs, model.I)
     model.Obj = Objective(rule=Obj_rule, sense=maximize)
     model.OnlyOneReltype = Constraint(model.Arcs, rule=OnlyOneReltype_rule) 
-    model.Transitivity = Constraint(model.Connected_Arcs, model.relTypes, model.relTypes, rule=Transitivity_rule)
+    if formulation == 'compact':
+        model.Groups = RangeSet(0, len(compactrelations)-1)
+        model.Transitivity = Constraint(model.Connected_Arcs, model.Groups, rule=CompactTransitivity_rule)
+    else:
+        model.Transitivity = Constraint(model.Connected_Arcs, model.relTypes, model.relTypes, rule=Transitivity_rule)
     print("Number of constraints: ", numConstraints)
     
     results = opt.solve(model)
     rDict = {}
     for (arcFrom, arcTo, index) in model.x.keys():
         arc = (arcFrom, arcTo)
-        if not rDict.has_key( arc ): rDict[arc] = []
-        rDict[arc].append(index)
+        if not rDict.has_key( arc ): rDict[arc] = [0]*len(reltypes)
+        rDict[arc][index] = int(round(model.x[arcFrom, arcTo, index].value or 0))
+    return rDict
+
+#############################################################################################################    
+#
+# Optimise Final Classifier using pyomo model
+#
+#v = {}              # contains dictionary passed from pre-processor
+df = pd.DataFrame(columns=('source', 'target', 'percent'))
+numConstraints = 0
+# formulation = 'full'    one transitivity constraint per triad and pair of reltypes (Transitivity_rule)
+#               'compact' one per triad and group of compactrelations (CompactTransitivity_rule)
+# solver      = name      'cplex', 'cbc', .. through SolverFactory, or 'highs' / 'ortools' in process on the
+#                         constraint matrix of ipmatrix.MatrixModel, without building the pyomo model
+# treewidth   = w         solves by dynamic programming over a tree decomposition of the arc graph, without a solver,
+#                         where its width is at most w (8**(w+1) entries per table) - None to always use the solver
+# models      = directory keeps each model built, and its LP file, under a hash of the document (ipmatrix.Cached_init),
+#                         so solving it again with another solver starts from the LP file - None for no model cache.
+#                         Pyomo cannot read a model back from a file, so the matrix model is used for all solvers
+def main(df_in, formulation='full', solver='cplex', treewidth=None, models=None):
+    global df
+    global numConstraints
+    numConstraints = 0
+    df = df_in
+    order = None
+    if treewidth != None:
+        (order, width) = arcgraph.Elimination_init(Arcs_init(df), Connected_Arcs_init(df), treewidth)
+    if order != None:
+        arcs = Arcs_init(df)
+        labels = consistency.Eliminate_init(dict((arc, df.loc[arc, 'percent']) for arc in arcs), Connected_Arcs_init(df),
+                                            masks, order)
+        rDict = dict((arc, [int(r == labels[arc]) for r in range(len(reltypes))]) for arc in arcs)
+    elif solver in ipmatrix.inProcessSolvers or models != None:
+        arcs = Arcs_init(df)
+        weights = [df.loc[arc, 'percent'] for arc in arcs]
+        build = lambda: ipmatrix.MatrixModel(arcs, weights, Connected_Arcs_init(df), templates[formulation], len(reltypes))
+        if models != None:
+            matrixModel = ipmatrix.Cached_init(models, (reltypes, compositerelations, formulation, arcs, weights), build)
+        else:
+            matrixModel = build()
+        numConstraints = matrixModel.numConstraints()
+        print("Number of constraints: ", numConstraints)
+        rDict = matrixModel.results(matrixModel.solve(solver))
+    else:
+        rDict = Model_main(formulation, solver)
     row = 0
     df_result = pd.DataFrame(columns=('source', 'target', 'relation'))
     for (arcFrom, arcTo) in rDict.keys():
@@ -204,7 +204,7 @@ def createResults() :
                 df_result = df_opt
             else :
                 #print("Optimise")
-                df_result = clinicaloptimizer.main(df_opt)
+                df_result = clinicaloptimizer.main(df_opt, formulation, solver, treewidth, models)
                 df_result['relation'] = df_result['relation'].map(convertTupleToRelation)
 
             buildResultFile(df_result, fileList[i], i)
@@ -309,6 +309,10 @@ resultFolder   = 'Ensemble_clinic_results/'
 tests   = ['A', 'B']
 pThreshold = 0.65
 optimise = 0
+formulation = 'full'            # 'full' or 'compact' transitivity constraints in clinicaloptimizer
+solver = 'cplex'                # run through SolverFactory, or 'highs' / 'ortools' in process
+treewidth = None                # dynamic programming instead of the solver up to this width, see clinicaloptimizer
+models = None                   # directory of built models reused by later runs, see clinicaloptimizer
 #for n in range(10) :
 for n in range(1) :
     testNum = str(n).zfill(2)
@@ -0,0 +1,357 @@
+"""
+Transitivity checks and repair of reltype labellings against a composition table,
+shared by optimizer.py and clinicaloptimizer.py
+
+This code is licensed under the Apache License, Version 2.0. You may
+obtain a copy of this license in the LICENSE file in the root
+directory of this source tree or at
+http://www.apache.org/licenses/LICENSE-2.0.
+Any modifications or derivative works of this code must retain this
+copyright notice, and modified files need to carry a notice
+indicating that they have been altered from the originals.
+
+If you use this code, please cite our paper:
+@article{Kerr2020,
+  author    = {Catherine Kerr and Terri Hoare and Paula Carroll and Jakub Marecek},
+  title     = {Integer-Programming Ensemble of Temporal-Relations Classifiers},
+  journal   = {Data Mining and Knowledge Discovery},
+  volume    = {to appear},
+  year      = {2020},
+  url       = {http://arxiv.org/abs/1412.1866},
+  archivePrefix = {arXiv},
+  eprint    = {1412.1866},
+}
+"""
+
+from time33 import perf_counter
+import numpy as np
+import ipmatrix
+
+###########################################################################################################
+#
+## Labellings
+##
+## A labelling maps each arc to the index of its reltype, as in maptuple
+
+# Closure of each constrained pair of reltype indices, as a set of reltype indices
+def Closure_table(reltypes, maptuple, compositerelations):
+    table = {}
+    for arc1RT in reltypes:
+        for arc2RT in reltypes:
+            arc3RT = ipmatrix.Closure(compositerelations, arc1RT, arc2RT)
+            if arc3RT != None:
+                table[maptuple[arc1RT], maptuple[arc2RT]] = frozenset(maptuple[r] for r in arc3RT)
+    return table
+
+# Triads that each arc takes part in, in any position
+def Arc_triads(triads):
+    retval = {}
+    for triad in triads:
+        (i,j,k) = triad
+        for arc in set(((i,j), (j,k), (i,k))):       # an arc repeated in a triad lists it once
+            if not arc in retval:
+                retval[arc] = []
+            retval[arc].append(triad)
+    return retval
+
+# True if the labelling breaks the transitivity rule of triad (i,j,k)
+def Broken(labels, triad, table):
+    (i,j,k) = triad
+    closure = table.get((labels[(i,j)], labels[(j,k)]))
+    return closure != None and not labels[(i,k)] in closure
+
+def Violated_init(labels, triads, table):
+    return [triad for triad in triads if Broken(labels, triad, table)]
+
+# Objective value of a labelling
+def Objective_init(weights, labels):
+    return sum(weights[arc][labels[arc]] for arc in labels)
+
+# Repair a labelling so that it breaks no transitivity rule, losing as little weight as possible.
+# For each broken triad (i,j,k), arc (i,k) is first relabelled to its heaviest reltype in the closure that
+# breaks none of its triads. Otherwise (i,j) or (j,k), whichever loses less weight, is set to noneRT, which
+# composes to '.' with every reltype. Each such step adds an arc labelled noneRT, so the repair ends and,
+# at worst, returns the labelling with every arc set to noneRT. Single arcs are then improved where they can be
+def Repair_init(labels, weights, triads, table, noneRT):
+    labels = dict(labels)
+    arcTriads = Arc_triads(triads)
+    broken = Violated_init(labels, triads, table)
+    while len(broken) > 0:
+        triad = broken.pop()
+        if not Broken(labels, triad, table):
+            continue
+        (i,j,k) = triad
+        arc3 = (i,k)
+        old = labels[arc3]
+        fixed = False
+        if old != noneRT:
+            closure = table[labels[(i,j)], labels[(j,k)]]
+            for r in sorted(closure, key=lambda r: (-weights[arc3][r], r)):
+                labels[arc3] = r
+                if len(Violated_init(labels, arcTriads[arc3], table)) == 0:
+                    fixed = True
+                    break
+            if not fixed:
+                labels[arc3] = old
+        if not fixed:
+            arc = min(((i,j), (j,k)), key=lambda arc: weights[arc][labels[arc]] - weights[arc][noneRT])
+            labels[arc] = noneRT
+            broken += Violated_init(labels, arcTriads[arc], table)
+    return Improve_init(labels, weights, arcTriads, table)
+
+# Relabel single arcs to heavier reltypes that break none of their triads, until no arc can be improved.
+# The objective rises with every change, so this ends
+def Improve_init(labels, weights, arcTriads, table):
+    improved = True
+    while improved:
+        improved = False
+        for arc in labels:
+            old = labels[arc]
+            for r in sorted(range(len(weights[arc])), key=lambda r: (-weights[arc][r], r)):
+                if weights[arc][r] <= weights[arc][old]:
+                    break
+                labels[arc] = r
+                if len(Violated_init(labels, arcTriads.get(arc, ()), table)) == 0:
+                    improved = True
+                    break
+                labels[arc] = old
+    return labels
+
+# Local search from a labelling, for documents too large for the solver. Each step takes a broken triad and makes
+# the move on one of its three arcs that breaks fewest triads, losing least weight on a tie, as long as it breaks
+# fewer triads than the labelling has now. Otherwise (i,j) or (j,k), whichever loses less weight, is set to noneRT as
+# in Repair_init, and that arc is not moved again: between two such steps the number of broken triads falls with
+# every step, so the search ends. Broken triads are kept as a set and only the triads of the arc moved are checked
+# again, so a step costs the number of triads of its three arcs. The search stops when no triad is broken, or at
+# the deadline (perf_counter), and single arcs are then improved. Returns the labelling and its broken triads
+def Search_init(labels, weights, triads, table, noneRT, deadline=None):
+    labels = dict(labels)
+    arcTriads = Arc_triads(triads)
+    broken = set(Violated_init(labels, triads, table))
+    frozen = set()
+    steps = 0
+    while len(broken) > 0:
+        steps += 1
+        if deadline != None and steps % 100 == 0 and perf_counter() > deadline:
+            return (labels, sorted(broken))
+        triad = next(iter(broken))
+        (i,j,k) = triad
+        best = None
+        for arc in set(((i,j), (j,k), (i,k))) - frozen:
+            old = labels[arc]
+            current = [t for t in arcTriads[arc] if t in broken]
+            for r in range(len(weights[arc])):
+                if r == old:
+                    continue
+                labels[arc] = r
+                newBroken = Violated_init(labels, arcTriads[arc], table)
+                score = (len(newBroken) - len(current), weights[arc][old] - weights[arc][r])
+                if score[0] < 0 and (best == None or score < best[0]):
+                    best = (score, arc, r, current, newBroken)
+            labels[arc] = old
+        if best == None:
+            arc = min(((i,j), (j,k)), key=lambda arc: weights[arc][labels[arc]] - weights[arc][noneRT])
+            labels[arc] = noneRT
+            frozen.add(arc)
+            current = [t for t in arcTriads[arc] if t in broken]
+            newBroken = Violated_init(labels, arcTriads[arc], table)
+        else:
+            (score, arc, r, current, newBroken) = best
+            labels[arc] = r
+        broken.difference_update(current)
+        broken.update(newBroken)
+    return (Improve_init(labels, weights, arcTriads, table), [])
+
+###########################################################################################################
+#
+## Domains
+##
+## The candidate reltypes of an arc are held as a bit mask, with bit r set if reltype index r is a candidate
+
+# Closure mask of every pair of reltype indices - every reltype if the pair does not constrain arc (i,k)
+def Mask_table(table, numRels):
+    full = (1 << numRels) - 1
+    masks = [[full]*numRels for r in range(numRels)]
+    for ((r1, r2), closure) in table.items():
+        masks[r1][r2] = sum(1 << r for r in closure)
+    return masks
+
+def Bits(mask):
+    return [r for r in range(mask.bit_length()) if mask >> r & 1]
+
+# An arc that never closes a triad as (i,k) can be relabelled noneRT without breaking any triad, since noneRT
+# composes to '.' with every reltype. Its reltypes weighing no more than noneRT can then be dropped without
+# losing every optimum. Arcs that close a triad keep all their reltypes
+def Domains_init(weights, triads, noneRT):
+    closing = set((i,k) for (i,j,k) in triads)
+    domains = {}
+    for arc in weights:
+        w = weights[arc]
+        if arc in closing:
+            domains[arc] = (1 << len(w)) - 1
+        else:
+            domains[arc] = sum(1 << r for r in range(len(w)) if w[r] > w[noneRT]) | 1 << noneRT
+    return domains
+
+# Sparse domains: the reltypes weighing more than epsilon and noneRT, together with every reltype that closes a
+# triad from the candidates of its other two arcs, added until no domain grows. Labelling every arc noneRT stays
+# feasible, but an optimum that uses a light reltype may be lost - epsilon trades this against the model size
+def Sparse_init(weights, triads, masks, epsilon, noneRT):
+    full = (1 << len(masks)) - 1
+    domains = {}
+    for arc in weights:
+        domains[arc] = sum(1 << r for r in range(len(weights[arc])) if weights[arc][r] > epsilon) | 1 << noneRT
+    arcTriads = Arc_triads(triads)
+    queue = list(triads)
+    queued = set(queue)
+    while len(queue) > 0:
+        triad = queue.pop()
+        queued.discard(triad)
+        (i,j,k) = triad
+        closing = 0
+        for r1 in Bits(domains[(i,j)]):
+            for r2 in Bits(domains[(j,k)]):
+                if masks[r1][r2] != full:
+                    closing |= masks[r1][r2]
+        if closing & ~domains[(i,k)]:
+            domains[(i,k)] |= closing
+            for other in arcTriads[(i,k)]:
+                if not other in queued:
+                    queue.append(other)
+                    queued.add(other)
+    return domains
+
+# Path consistency over the triads: a reltype of an arc is dropped when no candidate reltypes of the other two
+# arcs of one of its triads are consistent with it. Triads of the arcs that lose a reltype are checked again
+# until no domain changes. Only reltypes that appear in no consistent labelling within the domains are dropped
+def Propagate_init(domains, triads, masks):
+    domains = dict(domains)
+    arcTriads = Arc_triads(triads)
+    bits = {}
+    queue = list(triads)
+    queued = set(queue)
+    while len(queue) > 0:
+        triad = queue.pop()
+        queued.discard(triad)
+        (i,j,k) = triad
+        arcs = ((i,j), (j,k), (i,k))
+        (d1, d2, d3) = [domains[arc] for arc in arcs]
+        for d in (d1, d2):
+            if not d in bits:
+                bits[d] = Bits(d)
+        (n1, n2, n3) = (0, 0, 0)
+        for r1 in bits[d1]:
+            row = masks[r1]
+            for r2 in bits[d2]:
+                m = row[r2] & d3
+                if m:
+                    n1 |= 1 << r1
+                    n2 |= 1 << r2
+                    n3 |= m
+        for (arc, old, new) in zip(arcs, (d1, d2, d3), (n1, n2, n3)):
+            if new == old:
+                continue
+            if new == 0:
+                raise ValueError("No consistent labelling for arc " + str(arc))
+            domains[arc] &= new
+            for other in arcTriads[arc]:
+                if not other in queued:
+                    queue.append(other)
+                    queued.add(other)
+    return domains
+
+###########################################################################################################
+#
+## Fixing
+
+# Arcs whose heaviest reltype weighs at least threshold are fixed to it - with weight formula '1', a weight of 1.0
+# means every classifier that found the arc agreed on its reltype. The solver almost never changes such a label,
+# but fixing it is not exact. An arc stays fixed only while no triad has (i,j) and (j,k) fixed and (i,k) free or
+# broken: labelling every free arc noneRT then satisfies every triad, so fixing never makes the model infeasible.
+# Fixed reltypes must lie in the domains where given
+def Fixed_init(weights, triads, table, threshold, domains=None):
+    fixed = {}
+    for arc in weights:
+        w = list(weights[arc])
+        r = w.index(max(w))
+        if w[r] >= threshold and (domains == None or domains[arc] >> r & 1):
+            fixed[arc] = r
+    arcTriads = Arc_triads(triads)
+    queue = list(triads)
+    while len(queue) > 0:
+        triad = queue.pop()
+        (i,j,k) = triad
+        if not (i,j) in fixed or not (j,k) in fixed:
+            continue
+        if (i,k) in fixed and not Broken(fixed, triad, table):
+            continue
+        for arc in set(((i,j), (j,k), (i,k))):
+            if fixed.pop(arc, None) != None:
+                queue += arcTriads[arc]
+    return fixed
+
+###########################################################################################################
+#
+## Exact optimum over a tree decomposition
+##
+## A factor is (scope, table): a tuple of arcs and an array with one axis per arc of the scope, over the indices
+## of its candidate reltypes. Weights are unary factors, and each triad is a factor that is 0 where the triad is
+## satisfied and -inf where it is broken
+
+# Factor table over the axes of scope, in that order, with length 1 along the arcs that are not in factorScope
+def Align(table, factorScope, scope):
+    position = dict((arc, n) for (n, arc) in enumerate(scope))
+    axes = sorted(range(len(factorScope)), key=lambda n: position[factorScope[n]])
+    table = np.transpose(table, axes)
+    shape = [1]*len(scope)
+    for (m, n) in enumerate(axes):
+        shape[position[factorScope[n]]] = table.shape[m]
+    return table.reshape(shape)
+
+# Eliminate the arcs in order, e.g. from arcgraph.Elimination_init: the factors of an arc are summed over the arc
+# and its neighbours, and replaced by their maximum over the reltypes of the arc. The tables hold
+# len(reltypes)**(width+1) entries at most. The reltype of each arc is then read back in the reverse order.
+# Returns an optimal labelling within the domains where given
+def Eliminate_init(weights, triads, masks, order, domains=None):
+    numRels = len(masks)
+    bits = np.array([[[masks[r1][r2] >> r3 & 1 for r3 in range(numRels)] for r2 in range(numRels)]
+                     for r1 in range(numRels)], dtype=bool)
+    values = {}
+    for arc in order:
+        values[arc] = list(range(numRels)) if domains == None else Bits(domains[arc])
+    factors = []
+    for arc in order:
+        factors.append(((arc,), np.array([weights[arc][r] for r in values[arc]], dtype=float)))
+    for (i,j,k) in set(triads):
+        scope = ((i,j), (j,k), (i,k))
+        if len(set(scope)) < 3:                     # only a loop (i,i) repeats an arc, and arcs join distinct ids
+            continue
+        allowed = bits[np.ix_(values[(i,j)], values[(j,k)], values[(i,k)])]
+        factors.append((scope, np.where(allowed, 0.0, -np.inf)))
+    buckets = dict((arc, []) for arc in order)
+    for (n, (scope, table)) in enumerate(factors):
+        for arc in scope:
+            buckets[arc].append(n)
+    used = [False]*len(factors)
+    eliminated = []
+    for arc in order:
+        mine = [n for n in buckets[arc] if not used[n]]
+        scope = set()
+        for n in mine:
+            used[n] = True
+            scope |= set(factors[n][0])
+        rest = tuple(sorted(scope - set((arc,))))
+        scope = rest + (arc,)
+        total = sum(Align(factors[n][1], factors[n][0], scope) for n in mine)
+        eliminated.append((arc, rest, np.argmax(total, axis=-1)))
+        factors.append((rest, np.max(total, axis=-1)))
+        used.append(False)
+        for other in rest:
+            buckets[other].append(len(factors) - 1)
+    optimum = sum(table for (scope, table) in factors if len(scope) == 0)     # one per component of the arc graph
+    if optimum == -np.inf:
+        raise ValueError("No consistent labelling within the domains")
+    chosen = {}
+    for (arc, rest, argmax) in reversed(eliminated):
+        chosen[arc] = int(argmax[tuple(chosen[other] for other in rest)])
+    return dict((arc, values[arc][chosen[arc]]) for arc in order)
@@ -0,0 +1,106 @@
+"""
+Content-addressed cache of pickled values in a directory, with least-recently-used eviction
+
+This code is licensed under the Apache License, Version 2.0. You may
+obtain a copy of this license in the LICENSE file in the root
+directory of this source tree or at
+http://www.apache.org/licenses/LICENSE-2.0.
+Any modifications or derivative works of this code must retain this
+copyright notice, and modified files need to carry a notice
+indicating that they have been altered from the originals.
+
+If you use this code, please cite our paper:
+@article{Kerr2020,
+  author    = {Catherine Kerr and Terri Hoare and Paula Carroll and Jakub Marecek},
+  title     = {Integer-Programming Ensemble of Temporal-Relations Classifiers},
+  journal   = {Data Mining and Knowledge Discovery},
+  volume    = {to appear},
+  year      = {2020},
+  url       = {http://arxiv.org/abs/1412.1866},
+  archivePrefix = {arXiv},
+  eprint    = {1412.1866},
+}
+"""
+
+import cPickle
+import glob
+import hashlib
+import os
+import os.path
+
+###########################################################################################################
+#
+## Keys
+##
+## A key is the SHA-1 of a canonical form of its parts, so equal dictionaries give equal keys whatever the order
+## their items were added in. Floats are written with repr, which round-trips exactly
+
+def Canonical(value):
+    if isinstance(value, dict):
+        return "{" + ",".join(sorted(Canonical(k) + ":" + Canonical(value[k]) for k in value)) + "}"
+    if isinstance(value, (list, tuple)):
+        return "(" + ",".join(Canonical(item) for item in value) + ")"
+    if isinstance(value, (set, frozenset)):
+        return "{" + ",".join(sorted(Canonical(item) for item in value)) + "}"
+    return repr(value)
+
+def Key_init(*parts):
+    return hashlib.sha1(Canonical(parts)).hexdigest()
+
+###########################################################################################################
+#
+## Entries
+##
+## Each entry is a file named after its key. Its modification time is the time of its last use, so the oldest
+## entries go first once the directory holds more than maxEntries, along with any <key>.* files kept next to them
+
+def Path_init(directory, key, suffix=".pkl"):
+    return os.path.join(directory, key + suffix)
+
+# Value stored under key, or None if there is none or it cannot be read
+def Load(directory, key):
+    path = Path_init(directory, key)
+    try:
+        f = open(path, 'rb')
+        try:
+            value = cPickle.load(f)
+        finally:
+            f.close()
+        os.utime(path, None)
+    except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+        return None
+    return value
+
+# The entry is written under a temporary name and renamed, so a reader never sees half an entry
+def Store(directory, key, value, maxEntries=1000):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = Path_init(directory, key)
+    temp = path + "." + str(os.getpid())
+    f = open(temp, 'wb')
+    try:
+        cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+    finally:
+        f.close()
+    os.rename(temp, path)
+    Evict(directory, maxEntries)
+    return
+
+def Evict(directory, maxEntries, suffix=".pkl"):
+    paths = glob.glob(os.path.join(directory, "*" + suffix))
+    if len(paths) <= maxEntries:        # counting the entries is cheaper than reading the time of each
+        return
+    entries = []
+    for path in paths:
+        try:
+            entries.append((os.path.getmtime(path), path))
+        except OSError:                 # evicted by another process
+            pass
+    entries.sort()
+    for (mtime, path) in entries[:max(len(entries) - maxEntries, 0)]:
+        for entryFile in glob.glob(path[:-len(suffix)] + ".*"):     # the entry and the files kept next to it
+            try:
+                os.remove(entryFile)
+            except OSError:
+                pass
+    return
@@ -0,0 +1,432 @@
+"""
+Builds the IP of optimizer.py / clinicaloptimizer.py directly as sparse matrices and solves it
+without constructing a Pyomo model, either through an LP file or in process
+
+This code is licensed under the Apache License, Version 2.0. You may
+obtain a copy of this license in the LICENSE file in the root
+directory of this source tree or at
+http://www.apache.org/licenses/LICENSE-2.0.
+Any modifications or derivative works of this code must retain this
+copyright notice, and modified files need to carry a notice
+indicating that they have been altered from the originals.
+
+If you use this code, please cite our paper:
+@article{Kerr2020,
+  author    = {Catherine Kerr and Terri Hoare and Paula Carroll and Jakub Marecek},
+  title     = {Integer-Programming Ensemble of Temporal-Relations Classifiers},
+  journal   = {Data Mining and Knowledge Discovery},
+  volume    = {to appear},
+  year      = {2020},
+  url       = {http://arxiv.org/abs/1412.1866},
+  archivePrefix = {arXiv},
+  eprint    = {1412.1866},
+}
+"""
+
+import os
+import tempfile
+from time33 import perf_counter
+import numpy as np
+import scipy.sparse as sp
+import diskcache
+from pyomo.environ import *
+from pyomo.opt import SolverFactory
+try:
+    from scipy.optimize import milp, LinearConstraint, Bounds     # scipy 1.9 or later, solves with HiGHS
+except ImportError:
+    milp = None
+try:
+    from ortools.linear_solver import pywraplp
+except ImportError:
+    pywraplp = None
+
+# Solvers that take the matrices in memory - any other name is passed to SolverFactory with an LP file
+inProcessSolvers = ('highs', 'ortools')
+
+# Option that sets the relative MIP gap of each solver run through SolverFactory
+gapOptions = {'cplex': 'mipgap', 'cbc': 'ratioGap', 'glpk': 'mipgap', 'gurobi': 'MIPGap', 'scip': 'limits/gap'}
+
+# Upper bound on the maximised objective in the results of SolverFactory, given the objective of the solution found,
+# or None if there is none. The cbc plugin reports bounds of the negated objective that cbc minimises, with signs
+# that depend on how the search ended, so the tightest of the reported values that can bound the objective is used
+def Bound_init(results, solverName, objective):
+    bound = results.problem.upper_bound
+    if bound is None or abs(bound) == float('inf'):
+        return None
+    candidates = [bound]
+    if solverName == 'cbc':
+        candidates.append(-bound)
+    candidates = [b for b in candidates if b >= objective - 1e-6*max(abs(objective), 1)]
+    if len(candidates) == 0:
+        return None
+    return min(candidates)
+
+###########################################################################################################
+#
+## Composition templates
+##
+## A template is one transitivity row written for a generic triad (i,j,k): a list of
+## (position, reltype, coefficient) entries, where position 0 is arc (i,j), 1 is arc (j,k) and 2 is arc (i,k).
+## The right-hand side of every template row is 1.
+
+# Closure reltypes of a composition, or None if the composition does not constrain arc (i,k)
+def Closure(compositerelations, arc1RT, arc2RT):
+    arc3RT = compositerelations[arc1RT, arc2RT]
+    if arc3RT[0] == '.':
+        return None
+    if isinstance(arc3RT, str):                       # ('p') is the string 'p', not a tuple
+        arc3RT = (arc3RT,)
+    return arc3RT
+
+# Transitivity rules aggregated per (r1, closure): iR1j ^ j(R2 or R2' or ..)k => iR3k, where every R2 of the group
+# composes with R1 to the same closure R3. Exactly one reltype is chosen for arc (j,k), so a group row is broken
+# exactly when one of the rows it replaces is broken, and its LP relaxation is at least as tight
+# Returns (arc1RT, (arc2RT, ..), arc3RT) per group
+def Groups_init(reltypes, compositerelations):
+    groups = []
+    groupIndex = {}
+    for arc1RT in reltypes:
+        for arc2RT in reltypes:
+            arc3RT = Closure(compositerelations, arc1RT, arc2RT)
+            if arc3RT == None:
+                continue
+            key = (arc1RT, frozenset(arc3RT))
+            if not key in groupIndex:
+                groupIndex[key] = len(groups)
+                groups.append((arc1RT, (), arc3RT))
+            (arc1RT, arc2RTs, arc3RT) = groups[groupIndex[key]]
+            groups[groupIndex[key]] = (arc1RT, arc2RTs + (arc2RT,), arc3RT)
+    return groups
+
+# Group of each constrained pair of reltypes
+def Groups_index(groups):
+    retval = {}
+    for (group, (arc1RT, arc2RTs, arc3RT)) in enumerate(groups):
+        for arc2RT in arc2RTs:
+            retval[arc1RT, arc2RT] = group
+    return retval
+
+# formulation = 'full'     one template per pair of reltypes, as in Transitivity_rule: x[ij,r1] + x[jk,r2] - sum x[ik,r3] <= 1
+#               'compact'  one template per group of Groups_init: x[ij,r1] + sum x[jk,r2] - sum x[ik,r3] <= 1
+def Templates_init(reltypes, maptuple, compositerelations, formulation='full'):
+    templates = []
+    if formulation == 'compact':
+        for (arc1RT, arc2RTs, arc3RT) in Groups_init(reltypes, compositerelations):
+            template = [(0, maptuple[arc1RT], 1)]
+            template += [(1, maptuple[r], 1) for r in arc2RTs]
+            template += [(2, maptuple[r], -1) for r in arc3RT]
+            templates.append(template)
+        return templates
+    for arc1RT in reltypes:
+        for arc2RT in reltypes:
+            arc3RT = Closure(compositerelations, arc1RT, arc2RT)
+            if arc3RT == None:
+                continue
+            template = [(0, maptuple[arc1RT], 1), (1, maptuple[arc2RT], 1)]
+            template += [(2, maptuple[r], -1) for r in arc3RT]
+            templates.append(template)
+    return templates
+
+###########################################################################################################
+#
+## Matrix model
+
+class MatrixModel:
+
+  # allowed is an arcs x numRels boolean array of the x[arc, r] to create - all of them if None
+  # fixed is an arcs x numRels boolean array of the x[arc, r] fixed to 1 - the arcs with one are left out of the model
+  def __init__(self, arcs, weights, triads, templates, numRels, allowed=None, fixed=None):
+      self.arcs = list(arcs)                          # arc of each block of numRels columns
+      self.numRels = numRels                          # column arc*numRels + r is x[arc, r]
+      numArcs = len(self.arcs)
+      numVars = numArcs*numRels
+      arcIndex = dict((arc, n) for (n, arc) in enumerate(self.arcs))
+
+      # objective vector
+      self.c = np.asarray(weights, dtype=float).reshape(numVars)
+
+      # OnlyOneReltype: one row per arc
+      self.Aeq = sp.csr_matrix((np.ones(numVars), np.arange(numVars), np.arange(0, numVars+1, numRels)),
+                               shape=(numArcs, numVars))
+      self.beq = np.ones(numArcs)
+
+      # Transitivity: every template instantiated on every triad
+      triadArcs = np.array([(arcIndex[(i,j)], arcIndex[(j,k)], arcIndex[(i,k)]) for (i,j,k) in triads],
+                           dtype=int).reshape(-1, 3)
+      entries = [(row, position, r, coef) for (row, template) in enumerate(templates)
+                                          for (position, r, coef) in template]
+      (tRow, tPosition, tRel, tCoef) = np.array(entries, dtype=int).reshape(-1, 4).T
+      numTriads = len(triadArcs)
+      numTemplates = len(templates)
+      rows = (np.arange(numTriads)[:, None]*numTemplates + tRow[None, :]).ravel()
+      cols = (triadArcs[:, tPosition]*numRels + tRel[None, :]).ravel()
+      data = np.tile(tCoef, numTriads).astype(float)
+      self.Aub = sp.coo_matrix((data, (rows, cols)), shape=(numTriads*numTemplates, numVars)).tocsr()
+      self.Aub.eliminate_zeros()                      # terms cancel if a triad repeats an arc
+      self.bub = np.ones(numTriads*numTemplates)
+
+      # Fixed arcs: their x are constants, moved to the right-hand sides, and their columns and OnlyOneReltype rows
+      # are dropped like those of reltypes that are not allowed
+      self.fixedColumns = np.zeros(0, dtype=int)      # column of the full model of each x fixed to 1
+      self.constant = 0.0                             # objective of the fixed arcs
+      if fixed is not None:
+          fixed = np.asarray(fixed, dtype=bool).reshape(numArcs, numRels)
+          self.fixedColumns = np.flatnonzero(fixed.reshape(numVars))
+          self.constant = self.c[self.fixedColumns].sum()
+          self.bub = self.bub - np.asarray(self.Aub[:, self.fixedColumns].sum(axis=1)).ravel()
+          free = ~fixed.any(axis=1)
+          self.Aeq = self.Aeq[np.flatnonzero(free)]
+          self.beq = self.beq[free]
+          allowed = free[:, None] & (np.ones((numArcs, numRels), dtype=bool) if allowed is None
+                                     else np.asarray(allowed, dtype=bool).reshape(numArcs, numRels))
+
+      # Sparse domains: drop the columns of x[arc, r] that are not allowed, and the rows that can no longer be broken
+      self.columns = None                             # column of the full model for each column kept - None for all
+      if allowed is not None:
+          self.columns = np.flatnonzero(np.asarray(allowed, dtype=bool).reshape(numVars))
+          self.c = self.c[self.columns]
+          self.Aeq = self.Aeq[:, self.columns]
+          self.Aub = self.Aub[:, self.columns]
+          positive = np.asarray(self.Aub.multiply(self.Aub > 0).sum(axis=1)).ravel()
+          keep = np.flatnonzero(positive > self.bub)
+          self.Aub = self.Aub[keep]
+          self.bub = self.bub[keep]
+      self.rows = None                                # rows of Aub passed to the solver - None for all of them
+      self.numRounds = 0
+      self.status = None                              # 'optimal', or 'limit' if the last solve stopped at a limit
+      self.bound = None                               # upper bound on the objective from the last solve, if known
+      self.lpFiles = {}                               # LP file of the whole model by relax, see Cached_init
+      return
+
+  def numConstraints(self):
+      if self.rows is None:
+          return self.Aeq.shape[0] + self.Aub.shape[0]
+      return self.Aeq.shape[0] + len(self.rows)
+
+  # Transitivity rows broken by the assignment x
+  def violated(self, x):
+      return np.flatnonzero(self.Aub.dot(x) > self.bub + 0.5)
+
+  # Cutting planes: start without transitivity rows and add the ones broken by each incumbent until none are
+  # With a time limit each round gets the time left. If a round stops at a limit, or no time is left for it, the
+  # last incumbent is returned and may break transitivity rows
+  def solveCuts(self, solverName, timelimit=None, mipgap=None):
+      self.rows = np.zeros(0, dtype=int)
+      deadline = None if timelimit is None else perf_counter() + timelimit
+      x = None
+      while True:
+          remaining = None if deadline is None else max(deadline - perf_counter(), 0)
+          incumbent = x
+          x = self.solve(solverName, remaining, mipgap)
+          if x is None:
+              self.status = 'limit'
+              return incumbent
+          if self.status != 'optimal':
+              return x
+          violated = self.violated(x)
+          if len(violated) == 0:
+              return x
+          if deadline is not None and perf_counter() > deadline:
+              self.status = 'limit'
+              return x
+          self.rows = np.union1d(self.rows, violated)
+
+  # Transitivity rows passed to the solver and their right-hand sides
+  def activeRows(self):
+      if self.rows is None:
+          return (self.Aub, self.bub)
+      return (self.Aub[self.rows], self.bub[self.rows])
+
+  # Write the model in CPLEX LP format, with variable x<n> for column n - continuous in [0, 1] if relax
+  def writeLp(self, filename, relax=False):
+      lines = ["\\* IP ensemble of temporal relations classifiers *\\\n", "maximize\nobj:\n"]
+      lines += ["%+.17g x%d\n" % (self.c[n], n) for n in np.flatnonzero(self.c)]
+      if not np.any(self.c):
+          lines.append("0 x0\n")
+      lines.append("subject to\n")
+      lines += self.rowLines("eq", self.Aeq, "=", self.beq)
+      (Aub, bub) = self.activeRows()
+      lines += self.rowLines("ub", Aub, "<=", bub)
+      if relax:
+          lines.append("bounds\n")
+          lines += ["0 <= x%d <= 1\n" % n for n in range(len(self.c))]
+      else:
+          lines.append("bounds\nbinary\n")
+          lines += ["x%d\n" % n for n in range(len(self.c))]
+      lines.append("end\n")
+      f = open(filename, 'w')
+      f.write("".join(lines))
+      f.close()
+      return
+
+  def rowLines(self, prefix, A, sense, b):
+      lines = []
+      indptr = A.indptr.tolist()
+      terms = ["%+g x%d\n" % term for term in zip(A.data.tolist(), A.indices.tolist())]
+      rhs = ["%s %g\n" % (sense, bound) for bound in b.tolist()]
+      for row in range(A.shape[0]):
+          if indptr[row] == indptr[row+1]:            # 0 <= 1
+              continue
+          lines.append("%s%d:\n" % (prefix, row))
+          lines += terms[indptr[row]:indptr[row+1]]
+          lines.append(rhs[row])
+      return lines
+
+  # Solve within the time limit (seconds) and relative MIP gap where given, or the LP relaxation if relax
+  # Returns the column values, or None if the solver stopped at a limit without a solution
+  def solve(self, solverName, timelimit=None, mipgap=None, relax=False):
+      (self.status, self.bound) = ('optimal', None)
+      x = np.zeros(len(self.c))
+      if len(self.c) == 0:
+          return x
+      if timelimit is not None and timelimit <= 0:    # no time left for the solver
+          self.status = 'limit'
+          return None
+      if solverName == 'highs':
+          x = self.solveHighs(timelimit, mipgap, relax)
+      elif solverName == 'ortools':
+          x = self.solveOrtools(timelimit, mipgap, relax)
+      else:
+          x = self.solveLp(solverName, timelimit, mipgap, relax)
+      if self.bound is not None:
+          self.bound += self.constant
+      self.numRounds += 1
+      return x
+
+  # Hand the LP file straight to the solver and read back the column values
+  def solveLp(self, solverName, timelimit=None, mipgap=None, relax=False):
+      x = np.zeros(len(self.c))
+      opt = SolverFactory(solverName)
+      if mipgap is not None and solverName in gapOptions and not relax:
+          opt.options[gapOptions[solverName]] = mipgap
+      if self.rows is None and relax in self.lpFiles:
+          results = opt.solve(self.lpFiles[relax], timelimit=timelimit)
+      else:
+          (handle, lpFile) = tempfile.mkstemp(suffix=".lp")
+          os.close(handle)
+          try:
+              self.writeLp(lpFile, relax)
+              results = opt.solve(lpFile, timelimit=timelimit)
+          finally:
+              os.remove(lpFile)
+      if str(results.solver.termination_condition) != 'optimal':
+          self.status = 'limit'
+      if len(results.solution) == 0:
+          return None
+      for (name, val) in results.solution(0).variable.items():
+          if name[0] == 'x':
+              x[int(name[1:])] = val['Value']
+      self.bound = Bound_init(results, solverName, self.c.dot(x))
+      return x
+
+  # HiGHS through scipy.optimize.milp, which minimises
+  def solveHighs(self, timelimit=None, mipgap=None, relax=False):
+      if milp is None:
+          raise ImportError("solver 'highs' needs scipy 1.9 or later")
+      (Aub, bub) = self.activeRows()
+      constraints = [LinearConstraint(self.Aeq, self.beq, self.beq)]
+      if Aub.shape[0] > 0:
+          constraints.append(LinearConstraint(Aub, -np.inf, bub))
+      options = {}
+      if timelimit is not None:
+          options['time_limit'] = timelimit
+      if mipgap is not None:
+          options['mip_rel_gap'] = mipgap
+      res = milp(-self.c, integrality=np.zeros(len(self.c)) if relax else np.ones(len(self.c)), bounds=Bounds(0, 1),
+                 constraints=constraints,
+                 options=options)
+      if res.status != 0:
+          self.status = 'limit'
+      if getattr(res, 'mip_dual_bound', None) is not None:
+          self.bound = -res.mip_dual_bound
+      if res.x is None and res.status != 1:             # 1 is a time or iteration limit
+          raise RuntimeError("HiGHS found no solution: " + res.message)
+      return res.x
+
+  # CBC linked into OR-Tools, or GLOP for the LP relaxation
+  def solveOrtools(self, timelimit=None, mipgap=None, relax=False):
+      if pywraplp is None:
+          raise ImportError("solver 'ortools' needs the ortools package")
+      if relax:
+          opt = pywraplp.Solver('ipensemble', pywraplp.Solver.GLOP_LINEAR_PROGRAMMING)
+      else:
+          opt = pywraplp.Solver('ipensemble', pywraplp.Solver.CBC_MIXED_INTEGER_PROGRAMMING)
+      if timelimit is not None:
+          opt.SetTimeLimit(int(1000*timelimit))
+      parameters = pywraplp.MPSolverParameters()
+      if mipgap is not None:
+          parameters.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, mipgap)
+      if relax:
+          x = [opt.NumVar(0.0, 1.0, "x%d" % n) for n in range(len(self.c))]
+      else:
+          x = [opt.BoolVar("x%d" % n) for n in range(len(self.c))]
+      objective = opt.Objective()
+      for n in np.flatnonzero(self.c):
+          objective.SetCoefficient(x[n], float(self.c[n]))
+      objective.SetMaximization()
+      (Aub, bub) = self.activeRows()
+      for (A, lower, upper) in ((self.Aeq, self.beq, self.beq), (Aub, np.full(len(bub), -opt.infinity()), bub)):
+          indptr = A.indptr.tolist()
+          indices = A.indices.tolist()
+          data = A.data.tolist()
+          for row in range(A.shape[0]):
+              if indptr[row] == indptr[row+1]:
+                  continue
+              constraint = opt.Constraint(float(lower[row]), float(upper[row]))
+              for n in range(indptr[row], indptr[row+1]):
+                  constraint.SetCoefficient(x[indices[n]], data[n])
+      status = opt.Solve(parameters)
+      if status == pywraplp.Solver.NOT_SOLVED:          # stopped at the time limit without a solution
+          self.status = 'limit'
+          return None
+      if status != pywraplp.Solver.OPTIMAL and status != pywraplp.Solver.FEASIBLE:
+          raise RuntimeError("OR-Tools found no solution, status %d" % status)
+      if status == pywraplp.Solver.FEASIBLE:
+          self.status = 'limit'
+      self.bound = objective.Value() if relax else objective.BestBound()
+      return np.array([var.solution_value() for var in x])
+
+  # Assignment per arc in the format expected by Classifier.mapResults: 1 for the chosen reltype, 0 otherwise
+  def results(self, x):
+      rDict = {}
+      values = np.rint(self.fullColumns(x)).astype(int).reshape(len(self.arcs), self.numRels)
+      for (n, arc) in enumerate(self.arcs):
+          rDict[arc] = values[n].tolist()
+      return rDict
+
+  # Value of every x[arc, r] per arc, e.g. the fractional values of the LP relaxation
+  def fractions(self, x):
+      values = self.fullColumns(x).reshape(len(self.arcs), self.numRels)
+      return dict((arc, values[n].tolist()) for (n, arc) in enumerate(self.arcs))
+
+  # Column values of the full model: 0 for the columns left out, 1 for the fixed ones
+  def fullColumns(self, x):
+      if self.columns is None:
+          return np.asarray(x, dtype=float)
+      full = np.zeros(len(self.arcs)*self.numRels)
+      full[self.columns] = x
+      full[self.fixedColumns] = 1
+      return full
+
+###########################################################################################################
+#
+## Model cache
+##
+## A built model is pickled in directory under the hash of the parts it was built from, next to its LP file, so a
+## later run with other solver settings - solver, time limit, MIP gap - neither builds nor writes the model again.
+## The LP file is in CPLEX LP format, which cbc, cplex, glpk and gurobi read, and is named <key>.lp, or
+## <key>.relax.lp for the LP relaxation. build() builds the model on a miss
+
+def Cached_init(directory, parts, build, relax=False, maxEntries=1000):
+    key = diskcache.Key_init(*parts)
+    model = diskcache.Load(directory, key)
+    if model is None:
+        model = build()
+        diskcache.Store(directory, key, model, maxEntries)
+    lpFile = diskcache.Path_init(directory, key, ".relax.lp" if relax else ".lp")
+    if not os.path.isfile(lpFile):
+        temp = lpFile + "." + str(os.getpid())
+        model.writeLp(temp, relax)
+        os.rename(temp, lpFile)
+    model.lpFiles[relax] = lpFile
+    return model
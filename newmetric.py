@@ -28,7 +28,7 @@ If you use this code, please cite our paper:
 }
 """
 
-from classifier import Classifier
+from classifier import Classifier, Ensemble
 import glob
 import os.path
 import sys
@@ -201,13 +201,14 @@ def main(args):
     sysClassifiers = []
     (totalLinks, totalMatchedLinks, totalMatchedReltypes, totalGoldLinks) = (0, 0, 0, 0)
     for filename in filelist:
-        globalClassifier = Classifier("FINAL", True)         # TLINKS and probability of relTypes across ALL classifiers goes here
-        refClassifier = Classifier(refDir,False)
+        document = Ensemble()
+        globalClassifier = Classifier("FINAL", True, document)         # TLINKS and probability of relTypes across ALL classifiers goes here
+        refClassifier = Classifier(refDir,False, document)
         refClassifier.parseTml(filename)
         i = 0
         sysClassifiers = []
         for classifier in clList:
-            sysClassifiers.append(Classifier(classifier, False))
+            sysClassifiers.append(Classifier(classifier, False, document))
             cFilename = filename.replace(refDir,classifier)
             if os.path.isfile(cFilename):
 #                print "Calling parseTml ", cFilename, classifier
@@ -215,7 +216,7 @@ def main(args):
             else:
                 print "File ", cFilename, "not found"
             i += 1
-        (links, matchedLinks, matchedReltypes, goldLinks) = extract(filename, globalClassifier.getGlobalArcs())
+        (links, matchedLinks, matchedReltypes, goldLinks) = extract(filename, globalClassifier.ensemble.getGlobalArcs())
         totalLinks += links
         totalMatchedLinks += matchedLinks
         totalMatchedReltypes += matchedReltypes
@@ -1,5 +1,5 @@
 """
-Create IP model and solves is using the Cbc solver
+Create IP model and solves is using the Cbc solver (or any solver named in the solver argument)
 
 This code is licensed under the Apache License, Version 2.0. You may
 obtain a copy of this license in the LICENSE file in the root 
@@ -32,6 +32,14 @@ from pyomo.environ import *
 from pyomo.opt import SolverFactory
 #from pyomo import *
 import glob
+import multiprocessing
+import os.path
+import numpy as np
+from time33 import perf_counter
+import arcgraph
+import consistency
+import diskcache
+import ipmatrix
 
 ##############################################################################################################################################
 ## 
@@ -312,21 +320,16 @@ def Arcs_init(v):
 
 # Add connected tri-graphs to model
 def Connected_Arcs_init(v):
+    return arcgraph.Triads_init(v)
+
+# (left, right, reltype) of every x variable - all reltypes of every arc, or the reltypes in the bit mask domains
+def Domain_init(v, domains=None):
     retval = []
-    for arc1 in v:
-        i = arc1[0]
-        ij = arc1[1]
-        for arc2 in v:
-            if arc1 != arc2: 
-               jk = arc2[0]
-               k = arc2[1]
-               if ij == jk:
-                  ik = (i,k) 
-                  if ik in v:
-                    tuple = ()   
-                    tuple += (i,) + (ij,) + (k,) 
-                    retval +=(tuple,)
-    return retval                 
+    for arc in Arcs_init(v):
+        for i in range(len(reltypes)):
+            if domains == None or domains[arc] >> i & 1:
+                retval.append((arc[0], arc[1], i))
+    return retval
 
 # Loads 2-d arc/reltype weights into model
 def Rels_init(model, left, right, i):
@@ -343,7 +346,7 @@ def OnlyOneReltype_rule(model, left, right):
     global numConstraints
     index = (left, right)
     numConstraints += 1
-    return sum(model.x[index,i] for i in model.I) == 1
+    return sum(model.x[index,i] for i in model.I if (left,right,i) in model.Domain) == 1
 
 # Constraint - transitive closure rules
 def Transitivity_rule(model, i , j, k, arc1IntType, arc2IntType):
@@ -356,43 +359,923 @@ def Transitivity_rule(model, i , j, k, arc1IntType, arc2IntType):
     arc3RT = model.compositeRelations[arc1IntType, arc2IntType]
     if arc3RT[0] == '.':
         return Constraint.Feasible
+    if not (i,j,arc1RT) in model.Domain or not (j,k,arc2RT) in model.Domain:     # pruned reltypes are 0
+        return Constraint.Feasible
+    numConstraints += 1
+    return model.x[arc1,arc1RT] + model.x[arc2,arc2RT] - sum(model.x[arc3,model.mapTuple[arc3RT[j]]] for j in range(len(arc3RT)) if (i,k,model.mapTuple[arc3RT[j]]) in model.Domain) <=1            
+
+# Transitivity rules aggregated over the reltypes of arc (j,k) that give the same closure - see ipmatrix.Groups_init
+compactrelations = ipmatrix.Groups_init(reltypes, compositerelations)
+compactindex = ipmatrix.Groups_index(compactrelations)
+
+# Constraint - transitive closure rules, one per group of compactrelations
+def CompactTransitivity_rule(model, i, j, k, group):
+    global numConstraints
+    arc1 = (i,j)
+    arc2 = (j,k)
+    arc3 = (i,k)
+    (arc1IntType, arc2IntTypes, arc3RT) = compactrelations[group]
+    arc2IntTypes = [r for r in arc2IntTypes if (j,k,model.mapTuple[r]) in model.Domain]     # pruned reltypes are 0
+    if not (i,j,model.mapTuple[arc1IntType]) in model.Domain or len(arc2IntTypes) == 0:
+        return Constraint.Feasible
     numConstraints += 1
-    return model.x[arc1,arc1RT] + model.x[arc2,arc2RT] - sum(model.x[arc3,model.mapTuple[arc3RT[j]]] for j in range(len(arc3RT))) <=1            
+    return model.x[arc1,model.mapTuple[arc1IntType]] + sum(model.x[arc2,model.mapTuple[r]] for r in arc2IntTypes) - sum(model.x[arc3,model.mapTuple[r]] for r in arc3RT if (i,k,model.mapTuple[r]) in model.Domain) <= 1
 
 
 #############################################################################################################    
 #
-# Optimise Final Classifier using pyomo model
+# Build pyomo model for Final Classifier
 #
-v = {}              # contains dictionary passed from pre-processor
-numConstraints = 0
-def main(inDict):
-    global v
-    global numConstraints
-    numConstraints = 0
-    v = inDict
-    opt = SolverFactory('cplex')
+# formulation = 'full', 'compact' or 'cuts' - no transitivity constraints until they are added to model.Cuts
+# domains     = bit mask of the reltypes of each arc that get a variable - all of them if None
+# fixed       = reltype index of the arcs fixed by Fixed_init. Their variable is fixed to 1, so the solver gets it as
+#               a constant, and they get no OnlyOneReltype constraint. Triads of three fixed arcs are left out
+# mutable     = True      the weights in the objective can be changed after the model is built, see Update_main
+def Model_init(v, formulation='full', domains=None, fixed={}, mutable=False):
+    domains = Fixed_domains(v, domains, fixed)
     model = ConcreteModel()
     model.relTypes = Set(initialize=reltypes, ordered=True);
     model.mapTuple = Param(model.relTypes, initialize=maptuple)
     model.compositeRelations = Param (model.relTypes, model.relTypes, initialize=compositerelations) 
 
     model.I = RangeSet(0, 14)
-    model.Arcs = Set(initialize=Arcs_init(v))
-    model.Connected_Arcs = Set(initialize=Connected_Arcs_init(v), dimen=3)
-    model.Rels = Param(model.Arcs, model.I, initialize=Rels_init)
-    model.x = Var(model.Arcs, model.I, domain=Binary)
+    model.Arcs = Set(initialize=[arc for arc in Arcs_init(v) if not arc in fixed])
+    model.Connected_Arcs = Set(initialize=[(i,j,k) for (i,j,k) in Connected_Arcs_init(v)
+                                           if not ((i,j) in fixed and (j,k) in fixed and (i,k) in fixed)], dimen=3)
+    model.Domain = Set(initialize=Domain_init(v, domains), dimen=3)
+    model.Rels = Param(model.Domain, initialize=Rels_init, mutable=mutable)
+    model.x = Var(model.Domain, domain=Binary)
+    for arc in fixed:
+        model.x[arc[0], arc[1], fixed[arc]].fix(1)
     model.xProb = Param(model.Arcs, model.I)
     model.Obj = Objective(rule=Obj_rule, sense=maximize)
     model.OnlyOneReltype = Constraint(model.Arcs, rule=OnlyOneReltype_rule) 
-    model.Transitivity = Constraint(model.Connected_Arcs, model.relTypes, model.relTypes, rule=Transitivity_rule)
-    results = opt.solve(model)
+    if formulation == 'cuts':
+        model.Cuts = ConstraintList()             # Transitivity rules are added as they are found to be broken
+    elif formulation == 'compact':
+        model.Groups = RangeSet(0, len(compactrelations)-1)
+        model.Transitivity = Constraint(model.Connected_Arcs, model.Groups, rule=CompactTransitivity_rule)
+    else:
+        model.Transitivity = Constraint(model.Connected_Arcs, model.relTypes, model.relTypes, rule=Transitivity_rule)
+    return model
+
+# Build the same model as sparse matrices - composition templates replace the 225 Transitivity_rule calls per triad
+templates = {'full': ipmatrix.Templates_init(reltypes, maptuple, compositerelations, 'full'),
+             'compact': ipmatrix.Templates_init(reltypes, maptuple, compositerelations, 'compact')}
+
+def MatrixModel_init(v, formulation='full', domains=None, fixed={}):
+    arcs = Arcs_init(v)
+    allowed = None
+    if domains != None:
+        allowed = [[domains[arc] >> i & 1 for i in range(len(reltypes))] for arc in arcs]
+    fixedColumns = None
+    if len(fixed) > 0:
+        fixedColumns = [[arc in fixed and fixed[arc] == i for i in range(len(reltypes))] for arc in arcs]
+    return ipmatrix.MatrixModel(arcs, [v[arc] for arc in arcs], Connected_Arcs_init(v), templates[formulation], len(reltypes),
+                                allowed, fixedColumns)
+
+# Solved reltype per arc: 1 for the chosen reltype, 0 otherwise - same format as Classifier.maxProbability
+def Results_init(model):
     rDict = {}
     for (arcFrom, arcTo, index) in model.x.keys():
         arc = (arcFrom, arcTo)
-        if not rDict.has_key( arc ): rDict[arc] = []
-        rDict[arc].append(index)
+        if not rDict.has_key( arc ): rDict[arc] = [0]*len(reltypes)
+        rDict[arc][index] = int(round(model.x[arcFrom, arcTo, index].value or 0))
+    return rDict
+
+# Objective value of an assignment in the rDict format
+def Objective_init(v, rDict):
+    return sum(v[arc][rDict[arc].index(1)] for arc in v)
+
+# Transitivity rules broken by an assignment, indexed as in model.Transitivity
+def Violated_init(rDict, triads):
+    retval = []
+    for (i,j,k) in triads:
+        arc1RT = reltypes[rDict[(i,j)].index(1)]
+        arc2RT = reltypes[rDict[(j,k)].index(1)]
+        arc3RT = ipmatrix.Closure(compositerelations, arc1RT, arc2RT)
+        if arc3RT != None and not reltypes[rDict[(i,k)].index(1)] in arc3RT:
+            retval.append((i, j, k, arc1RT, arc2RT))
+    return retval
+
+#############################################################################################################    
+#
+# Warm start from the max-probability labelling of Classifier.maxProbability, repaired to satisfy transitivity
+#
+closures = consistency.Closure_table(reltypes, maptuple, compositerelations)
+
+def WarmStart_init(v, triads):
+    labels = dict((arc, Argmax_init(v[arc]).index(1)) for arc in v)
+    return consistency.Repair_init(labels, v, triads, closures, maptuple['n'])
+
+# Load a labelling into model.x as the MIP start passed to the solver with warmstart=True
+# With pruned domains a reltype of the labelling may have no variable, and the solver repairs the start
+# Fixed variables keep their value
+def WarmStart_load(model, labels):
+    for (arcFrom, arcTo, index) in model.x.keys():
+        if not model.x[arcFrom, arcTo, index].fixed:
+            model.x[arcFrom, arcTo, index].value = int(labels[arcFrom, arcTo] == index)
+    return
+
+# start is the objective of the warm start and gap its relative distance to the optimum
+# bound is the upper bound on the objective and mipgap the relative distance of the objective to it
+def Stats_init(start, objective, status='optimal', bound=None):
+    stats = {'objective': objective, 'status': status}
+    if start != None:
+        stats['start'] = start
+        stats['gap'] = (objective - start)/max(abs(objective), 1e-10)
+    if bound != None:
+        stats['bound'] = bound
+        stats['mipgap'] = max(bound - objective, 0)/max(abs(objective), 1e-10)
+    return stats
+
+#############################################################################################################    
+#
+# Time and gap limits
+#
+# Solve the pyomo model within the time limit (seconds) and the relative MIP gap of options, from the warm start
+# if there is one. Returns (status, bound): status is 'optimal', 'limit' if the solver stopped at a limit with a
+# solution, or None if it found none, and bound is the upper bound on the objective reported by the solver
+def Model_solve(opt, model, solverName, options, start=None, timelimit=None):
+    if timelimit != None and timelimit <= 0:    # no time left for the solver
+        return (None, None)
+    kwargs = {'load_solutions': False}
+    if timelimit != None:
+        kwargs['timelimit'] = timelimit
+    if options['mipgap'] != None and solverName in ipmatrix.gapOptions:
+        opt.options[ipmatrix.gapOptions[solverName]] = options['mipgap']
+    if start != None:
+        WarmStart_load(model, start)
+        kwargs['warmstart'] = True
+    return Solution_load(model, opt.solve(model, **kwargs), solverName)
+
+# Load the solution in the results of a solve into model and return (status, bound) as Model_solve. A persistent
+# solver always reports a solution, with no variable values if it found none
+def Solution_load(model, results, solverName, persistent=False):
+    if len(results.solution) == 0 or (persistent and len(results.solution(0).variable) == 0):
+        return (None, None)
+    model.solutions.load_from(results)
+    bound = ipmatrix.Bound_init(results, solverName, value(model.Obj))
+    if str(results.solver.termination_condition) != 'optimal':
+        return ('limit', bound)
+    return ('optimal', bound)
+
+# Time left of timelimit seconds from begin, so building the model counts against the limit of the document. Once
+# none is left no model is built nor solver started, and the document gets the fallback labelling. Writing the
+# model for the solver is not interrupted, so a solver that reads a file can still take that long past the limit
+def Remaining_init(begin, timelimit):
+    if timelimit == None:
+        return None
+    return max(timelimit - (perf_counter() - begin), 0)
+
+def Labels_init(rDict):
+    return dict((arc, rDict[arc].index(1)) for arc in rDict)
+
+def Labels_results(labels):
+    rDict = {}
+    for arc in labels:
+        rDict[arc] = [0]*len(reltypes)
+        rDict[arc][labels[arc]] = 1
     return rDict
 
+# LP relaxation and rounding
+#
+# Fractional value of every x[arc, r] of the relaxed pyomo model - 0 for the reltypes without a variable
+def Fractions_init(model):
+    fractions = {}
+    for (arcFrom, arcTo, index) in model.x.keys():
+        fractions.setdefault((arcFrom, arcTo), [0.0]*len(reltypes))[index] = model.x[arcFrom, arcTo, index].value or 0.0
+    return fractions
+
+# Each arc takes its reltype with the largest x, the heavier one on a tie, and the labelling is repaired to satisfy
+# transitivity. The fractions are kept in confidence
+def Round_init(v, fractions, triads):
+    global confidence
+    confidence = fractions
+    labels = dict((arc, max(range(len(reltypes)), key=lambda r: (fractions[arc][r], v[arc][r]))) for arc in v)
+    return Labels_results(consistency.Repair_init(labels, v, triads, closures, maptuple['n']))
+
+# Objective of the LP relaxation - an upper bound on the optimum
+def Objective_relaxation(v, fractions):
+    return sum(v[arc][r]*fractions[arc][r] for arc in v for r in range(len(reltypes)))
+
+# Local search
+#
+# Local search from the max-probability labelling - see consistency.Search_init. Returns the assignment and the
+# triads it still breaks, if the search stopped at the deadline
+def Search_main(v, triads, deadline=None):
+    labels = dict((arc, Argmax_init(v[arc]).index(1)) for arc in v)
+    (labels, broken) = consistency.Search_init(labels, v, triads, closures, maptuple['n'], deadline)
+    return (Labels_results(labels), broken)
+
+# Status of a decomposed document - the worst of its components
+statusOrder = ['optimal', 'rounded', 'heuristic', 'limit', 'fallback']
+
+# Append the status, objective, MIP gap and time of a document to a CSV file - from stats unless docStats is given
+def Stats_write(filename, document, docStats=None):
+    if docStats == None:
+        docStats = stats
+    newFile = not os.path.isfile(filename)
+    f = open(filename, 'a')
+    if newFile:
+        f.write("document,status,objective,mipgap,time\n")
+    f.write("%s,%s,%s,%s,%s\n" % (document, docStats['status'], docStats['objective'], docStats.get('mipgap', ''),
+                                  docStats['time']))
+    f.close()
+    return
+
+#############################################################################################################    
+#
+# Prune the reltypes of each arc before the model is built - see consistency.py
+#
+masks = consistency.Mask_table(closures, len(reltypes))
+
+# Pruning starts from domains where given, e.g. the sparse domains of Sparse_init
+def Prune_init(v, triads, domains=None):
+    dominance = consistency.Domains_init(v, triads, maptuple['n'])
+    if domains != None:
+        dominance = dict((arc, dominance[arc] & domains[arc]) for arc in v)
+    return consistency.Propagate_init(dominance, triads, masks)
+
+# Reltypes weighing more than epsilon and the ones needed to close their triads - see consistency.Sparse_init
+def Sparse_init(v, triads, epsilon):
+    return consistency.Sparse_init(v, triads, masks, epsilon, maptuple['n'])
+
+# Arcs whose heaviest reltype weighs at least threshold, fixed to it - see consistency.Fixed_init
+def Fixed_init(v, triads, threshold, domains=None):
+    return consistency.Fixed_init(v, triads, closures, threshold, domains)
+
+# Domains with the fixed arcs reduced to their reltype
+def Fixed_domains(v, domains, fixed):
+    if len(fixed) == 0:
+        return domains
+    return dict((arc, 1 << fixed[arc] if arc in fixed else (2**len(reltypes) - 1 if domains == None else domains[arc]))
+                for arc in v)
+
+# Cutting planes: solve with OnlyOneReltype only, then add the Transitivity rules broken by the incumbent
+# and re-solve until none are broken. A persistent solver keeps its instance between rounds where available
+# The warm start satisfies every Transitivity rule, so it is a feasible start in every round
+# With a time limit each round gets the time left, and the rounds stop at the first one that ends at a limit or
+# has no time left, with the last incumbent. Returns (rDict, status, bound) as Model_solve, and rDict may then break
+# Transitivity rules
+def Cuts_main(v, solverName, options, start=None, domains=None, fixed={}):
+    global numRounds
+    if options['timelimit'] != None and options['timelimit'] <= 0:      # no time left for the solver
+        return (None, 'limit', None)
+    deadline = None if options['timelimit'] == None else perf_counter() + options['timelimit']
+    formulation = options['formulation']
+    model = Model_init(v, 'cuts', domains, fixed)
+    triads = list(model.Connected_Arcs)
+    opt = SolverFactory(solverName+'_persistent')
+    persistent = opt.available(exception_flag=False) and options['timelimit'] == None and options['mipgap'] == None
+    if persistent:
+        opt.set_instance(model)
+    else:
+        opt = SolverFactory(solverName)
+    rDict = None
+    while True:
+        if persistent:
+            if start == None:
+                results = opt.solve(model, load_solutions=False)
+            else:
+                WarmStart_load(model, start)
+                results = opt.solve(model, warmstart=True, load_solutions=False)
+            (status, bound) = Solution_load(model, results, solverName, persistent)
+        else:
+            remaining = None if deadline == None else max(deadline - perf_counter(), 0)
+            (status, bound) = Model_solve(opt, model, solverName, options, start, remaining)
+        numRounds += 1
+        if status == None:
+            return (rDict, 'limit', bound)
+        rDict = Results_init(model)
+        violated = Violated_init(rDict, triads)
+        if len(violated) == 0:
+            return (rDict, status, bound)
+        if status != 'optimal' or (deadline != None and perf_counter() > deadline):
+            return (rDict, 'limit', bound)
+        for (i, j, k, arc1RT, arc2RT) in violated:
+            if formulation == 'compact':
+                cut = model.Cuts.add(CompactTransitivity_rule(model, i, j, k, compactindex[arc1RT, arc2RT]))
+            else:
+                cut = model.Cuts.add(Transitivity_rule(model, i, j, k, arc1RT, arc2RT))
+            if persistent:
+                opt.add_constraint(cut)
+
+#############################################################################################################    
+#
+# Decompose Final Classifier into connected components of the arc graph
+#
+# Arc with no triad - the optimum is its reltype with maximum weight
+def Argmax_init(weights):
+    retval = [0]*len(weights)
+    retval[list(weights).index(max(weights))] = 1
+    return retval
+
+# Solve one component - runs in a worker process when workers > 1, so counters are returned rather than shared
+def Component_main(args):
+    (inDict, opt, options) = args
+    rDict = Solve_main(inDict, opt, options)
+    return (rDict, numConstraints, numRounds, stats, confidence)
+
+# Results of Component_main for each job (inDict, opt, options), in no particular order
+def Jobs_main(jobs, workers, deadline):
+    if workers > 1 and len(jobs) > 1:
+        # longest first, one job at a time, so no worker is left with a large job at the end
+        jobs = sorted(jobs, key=lambda job: -Cost_init(len(job[0]), len(Connected_Arcs_init(job[0]))))
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        results = list(pool.imap_unordered(Component_main, jobs))
+        pool.close()
+        pool.join()
+        return results
+    # jobs solved one after the other share the time limit of the document; in parallel each gets all of it
+    results = []
+    for (jobDict, jobOpt, jobOptions) in jobs:
+        if deadline != None:
+            jobOptions = dict(jobOptions, timelimit=max(deadline - perf_counter(), 0))
+        results.append(Component_main((jobDict, jobOpt, jobOptions)))
+    return results
+
+def Decompose_main(inDict, opt, options, workers):
+    global numConstraints
+    global numRounds
+    global stats
+    global confidence
+    begin = perf_counter()
+    components = arcgraph.Components_init(Arcs_init(inDict), Connected_Arcs_init(inDict))
+    rDict = {}
+    fractions = {}
+    jobs = []
+    for component in components:
+        if len(component) == 1:
+            rDict[component[0]] = Argmax_init(inDict[component[0]])
+            fractions[component[0]] = [float(x) for x in rDict[component[0]]]     # the LP optimum of a lone arc
+        else:
+            jobs.append((dict((arc, inDict[arc]) for arc in component), opt, options))
+    results = Jobs_main(jobs, workers, None if options['timelimit'] == None else begin + options['timelimit'])
+    (totalConstraints, totalRounds, totalVariables, totalFixed, totalViolations) = (0, 0, len(rDict), 0, 0)
+    width = 0
+    start = consistency.Objective_init(inDict, Labels_init(rDict))       # argmax arcs
+    (status, bound) = ('optimal', start)
+    for (result, jobConstraints, jobRounds, jobStats, jobConfidence) in results:
+        rDict.update(result)
+        fractions.update(jobConfidence)
+        totalConstraints += jobConstraints
+        totalRounds += jobRounds
+        totalVariables += jobStats['variables']
+        totalFixed += jobStats['fixed']
+        totalViolations += jobStats.get('violations', 0)
+        if 'width' in jobStats:
+            width = max(width, jobStats['width'])
+        start += jobStats.get('start', 0)
+        status = max(status, jobStats['status'], key=statusOrder.index)
+        bound = None if bound == None or not 'bound' in jobStats else bound + jobStats['bound']
+    (numConstraints, numRounds) = (totalConstraints, totalRounds)
+    confidence = fractions if opt == '4' else {}
+    stats = Stats_init(start if options['warmstart'] else None, Objective_init(inDict, rDict), status, bound)
+    stats['variables'] = totalVariables
+    stats['fixed'] = totalFixed
+    if opt == '3':
+        stats['violations'] = totalViolations
+    if options['treewidth'] != None and opt in ('1', '2'):
+        stats['width'] = width
+    stats['time'] = perf_counter() - begin
+    return rDict
+
+# Shard a long document into windows of size entities in arcgraph.Band_init order, each window sharing overlap
+# entities with the next. Each window is solved on its own, in parallel with workers > 1. The arcs with an entity
+# in an overlap, or in no window, are then re-solved together - the stitch - with the other arcs of their triads
+# fixed to the reltypes of their windows. Every other arc lies in a single window, and so does every triad of such
+# arcs, so the stitched assignment breaks no triad. A stitch stopped at a limit may move the fixed arcs in its
+# fallback or repair, so the triads of the document are then checked and any broken one repaired. No solve holds
+# more than a window or the overlaps, but the assignment need not be optimal for the document, so the status is
+# 'heuristic' at best and the bound is not known
+def Shard_main(inDict, opt, options, workers, size, overlap):
+    global v
+    global numConstraints
+    global numRounds
+    global stats
+    global confidence
+    begin = perf_counter()
+    deadline = None if options['timelimit'] == None else begin + options['timelimit']
+    arcs = Arcs_init(inDict)
+    order = arcgraph.Band_init(arcs)
+    starts = range(0, max(len(order) - overlap, 1), max(size - overlap, 1))
+    windows = [set(order[start:start + size]) for start in starts]
+    shared = set(entity for (n, window) in enumerate(windows[1:]) for entity in window & windows[n])
+    stitched = set(arcs)                    # arcs in no window are left to the stitch
+    jobs = []
+    for window in windows:
+        windowArcs = [arc for arc in arcs if arc[0] in window and arc[1] in window]
+        stitched.difference_update(arc for arc in windowArcs if not arc[0] in shared and not arc[1] in shared)
+        if len(windowArcs) > 0:
+            jobs.append((dict((arc, inDict[arc]) for arc in windowArcs), opt, options))
+    results = Jobs_main(jobs, workers, deadline)
+    rDict = {}
+    fractions = {}
+    (totalConstraints, totalRounds, totalVariables, totalFixed, status) = (0, 0, 0, 0, 'optimal')
+    for (result, jobConstraints, jobRounds, jobStats, jobConfidence) in results:
+        rDict.update((arc, result[arc]) for arc in result if not arc in stitched)
+        fractions.update((arc, jobConfidence[arc]) for arc in jobConfidence if not arc in stitched)
+        totalConstraints += jobConstraints
+        totalRounds += jobRounds
+        totalVariables += jobStats['variables']
+        totalFixed += jobStats['fixed']
+        status = max(status, jobStats['status'], key=statusOrder.index)
+    if len(stitched) > 0:
+        triads = Connected_Arcs_init(inDict)
+        neighbours = set(arc for (i,j,k) in triads if len(stitched & set(((i,j), (j,k), (i,k)))) > 0
+                         for arc in ((i,j), (j,k), (i,k)) if not arc in stitched)
+        fixed = dict((arc, rDict[arc].index(1)) for arc in neighbours)
+        # the reductions and the warm start do not know of the fixed arcs, and the stitch is small anyway
+        stitchOptions = dict(options, warmstart=False, prune=False, epsilon=None, fix=None,
+                             timelimit=None if deadline == None else max(deadline - perf_counter(), 0))
+        result = Solve_main(dict((arc, inDict[arc]) for arc in stitched | neighbours), opt, stitchOptions, fixed)
+        rDict.update((arc, result[arc]) for arc in stitched)
+        fractions.update((arc, confidence[arc]) for arc in stitched if arc in confidence)
+        totalConstraints += numConstraints
+        totalRounds += numRounds
+        totalVariables += stats['variables']
+        status = max(status, stats['status'], key=statusOrder.index)
+        if len(Violated_init(rDict, triads)) > 0:
+            rDict = Labels_results(consistency.Repair_init(Labels_init(rDict), inDict, triads, closures, maptuple['n']))
+    (v, numConstraints, numRounds) = (inDict, totalConstraints, totalRounds)
+    confidence = fractions if opt == '4' else {}
+    stats = Stats_init(None, Objective_init(inDict, rDict), max(status, 'heuristic', key=statusOrder.index), None)
+    stats['variables'] = totalVariables
+    stats['fixed'] = totalFixed
+    stats['windows'] = len(jobs)
+    stats['stitched'] = len(stitched)
+    stats['time'] = perf_counter() - begin
+    return rDict
+
+#############################################################################################################    
+#
+# Optimise Final Classifier using pyomo model
+# opt         = '1'       all transitivity constraints up front
+#               '2'       cutting planes - transitivity constraints added only once they are broken
+#               '3'       local search from the max-probability labelling (Search_main), without a solver. The
+#                         status is 'heuristic', or 'limit' if the time limit stopped the search, and stats reports
+#                         the number of triads the assignment still breaks in 'violations'
+#                         With treewidth set, '1' and '2' are solved without a solver by dynamic programming
+#                         over a tree decomposition of the arc graph (consistency.Eliminate_init) where its width
+#                         is at most treewidth - stats reports the width found
+#               '4'       LP relaxation, rounded to the reltype of each arc with the largest x and repaired
+#                         (Round_init). confidence holds the fractional x of every arc, the status is 'rounded'
+#                         and the bound is the LP optimum - or 'limit' and the solver's bound if the LP stopped
+#                         at a limit
+# backend     = 'pyomo'   builds a pyomo ConcreteModel with the rules above
+#               'matrix'  builds the constraint matrix in bulk (see ipmatrix.py) and hands it to the solver as an LP file
+# solver      = name      'cplex', 'cbc', 'glpk', .. are run through SolverFactory
+#                         'highs' (scipy.optimize.milp) and 'ortools' take the constraint matrix in process, so they
+#                         always use the matrix backend and no solver process or file is involved
+# formulation = 'full'    one transitivity constraint per triad and pair of reltypes (Transitivity_rule)
+#               'compact' one per triad and group of compactrelations (CompactTransitivity_rule)
+# decompose   = True      solves each connected component of the arc graph separately, arcs in no triad by argmax
+# workers     = n         number of processes solving components, or windows, in parallel
+# shard       = size      solves documents of more than size entities window by window, each window sharing overlap
+#                         entities with the next, and re-solves the arcs in the overlaps with their neighbours fixed
+#                         (Shard_main) - None to solve the document whole. Not for opt '3', which needs no solver.
+#                         stats reports the number of windows and of arcs re-solved in 'windows' and 'stitched'
+# overlap     = n         number of entities shared by neighbouring windows
+# warmstart   = True      passes the repaired max-probability labelling to the solver as a MIP start (pyomo backend)
+#                         and reports its gap to the optimum in stats
+# prune       = True      creates variables only for the reltypes that survive dominance and path-consistency pruning
+#                         (Prune_init) - stats reports the number of variables
+# epsilon     = e         creates variables only for the reltypes of an arc weighing more than e, NONE, and the
+#                         reltypes needed to close their triads (Sparse_init) - None for all reltypes
+# fix         = t         fixes the arcs whose heaviest reltype weighs at least t, e.g. 1.0 where every classifier
+#                         agreed, as long as no triad is made infeasible (Fixed_init), and leaves them out of the
+#                         model - None to fix none. stats reports the number of arcs fixed. Fixing is not exact,
+#                         so once any arc is fixed the status is 'heuristic' at best and the bound is not known
+# treewidth   = w         largest width of the tree decomposition solved by dynamic programming. The tables hold
+#                         15**(w+1) entries, so w is 3 or 4 at most - None to always use the solver
+# timelimit   = seconds   time limit of each document, counting the triads, domains and model built before the solver
+#                         starts (Remaining_init) - None for no limit
+# mipgap      = g         relative MIP gap at which the solver stops - None for the solver's default
+#                         At a limit the best solution found is returned, repaired if cutting planes stopped early,
+#                         or the repaired max-probability labelling if the solver found none (status 'fallback')
+# cache       = directory keeps the solution of each document with a status in cacheStatuses - 'optimal', 'rounded' or
+#                         'heuristic', none of which stopped at a limit - under a hash of its arcs, the relation
+#                         algebra and the options (Cache_key), so a document seen before is not solved again. A
+#                         solution with status 'limit' or 'fallback' depends on the machine and is not kept
+#                         - None for no cache. stats of a cached solution are those of the solve, with 'cached' set
+# cacheSize   = n         number of solutions kept in the cache - the least recently used go first
+# models      = directory keeps each matrix model built, and its LP file, under a hash of its arcs, the relation algebra
+#                         and the domains (ipmatrix.Cached_init), so the same document solved again with another solver,
+#                         time limit or MIP gap is neither built nor written again - None for no model cache. Pyomo
+#                         cannot read a model back from a file, so with a model cache the pyomo backend uses the
+#                         matrix model too
+# modelsSize  = n         number of models kept in the model cache - the least recently used go first
+#
+# v, stats, confidence and the counts below are module globals set by each call, so documents are optimised in
+# parallel by processes (Parallel_main, parallel= of ensemble.py), not by threads sharing this module
+v = {}              # contains dictionary passed from pre-processor
+numConstraints = 0
+numRounds = 0       # number of solves - more than 1 with cutting planes or decomposition
+stats = {}          # status, objective, bound, MIP gap and time of the last document, see Stats_init
+confidence = {}     # value of every x[arc, r] in the LP relaxation of the last document with opt '4', per arc
+def Solve_main(inDict, opt, options, fixed={}):
+    global v
+    global numConstraints
+    global numRounds
+    global stats
+    global confidence
+    begin = perf_counter()
+    numConstraints = 0
+    numRounds = 0
+    confidence = {}
+    v = inDict
+    formulation = options['formulation']
+    triads = Connected_Arcs_init(v)
+    start = None
+    if options['warmstart']:
+        start = WarmStart_init(v, triads)
+    domains = None
+    if options['epsilon'] != None and opt != '3':
+        domains = Sparse_init(v, triads, options['epsilon'])
+    if options['prune'] and opt != '3':
+        domains = Prune_init(v, triads, domains)
+    fixed = dict(fixed)                     # arcs fixed by the caller, see Shard_main
+    if options['fix'] != None and opt != '3':
+        fixed.update(Fixed_init(v, triads, options['fix'], domains))
+    solverName = options['solver']
+    broken = []
+    (order, width) = (None, None)
+    if options['treewidth'] != None and opt in ('1', '2'):
+        (order, width) = arcgraph.Elimination_init(Arcs_init(v), triads, options['treewidth'])
+    if opt != '3' and Remaining_init(begin, options['timelimit']) == 0:      # no time left to build a model
+        (rDict, status, bound) = (None, None, None)
+    elif opt == '3':
+        (rDict, broken) = Search_main(v, triads, None if options['timelimit'] == None else begin + options['timelimit'])
+        (status, bound) = ('heuristic' if len(broken) == 0 else 'limit', None)
+    elif order != None:
+        labels = consistency.Eliminate_init(v, triads, masks, order, Fixed_domains(v, domains, fixed))
+        (rDict, status, bound) = (Labels_results(labels), 'optimal', None)
+    elif options['backend'] == 'matrix' or solverName in ipmatrix.inProcessSolvers or options['models'] != None:
+        if options['models'] != None:
+            matrixModel = ipmatrix.Cached_init(options['models'], (formulationVersion, reltypes, compositerelations,
+                                               formulation, domains, fixed, v),
+                                               lambda: MatrixModel_init(v, formulation, domains, fixed), opt == '4',
+                                               options['modelsSize'])
+        else:
+            matrixModel = MatrixModel_init(v, formulation, domains, fixed)
+        if opt == '2':
+            x = matrixModel.solveCuts(solverName, Remaining_init(begin, options['timelimit']), options['mipgap'])
+        else:
+            x = matrixModel.solve(solverName, Remaining_init(begin, options['timelimit']), options['mipgap'],
+                                  relax=opt == '4')
+        numConstraints = matrixModel.numConstraints()
+        numRounds = matrixModel.numRounds
+        (status, bound) = (matrixModel.status, matrixModel.bound)
+        if opt == '4':
+            rDict = None if x is None else Round_init(v, matrixModel.fractions(x), triads)
+        else:
+            rDict = None if x is None else matrixModel.results(x)
+    elif opt == '2':
+        (rDict, status, bound) = Cuts_main(v, solverName, dict(options, timelimit=Remaining_init(begin, options['timelimit'])),
+                                           start, domains, fixed)
+    else:
+        ipSolver = SolverFactory(solverName)
+        model = Model_init(v, formulation, domains, fixed)
+        if opt == '4':
+            TransformationFactory('core.relax_integer_vars').apply_to(model)
+        (status, bound) = Model_solve(ipSolver, model, solverName, options, None if opt == '4' else start,
+                                      Remaining_init(begin, options['timelimit']))
+        numRounds = 1
+        if opt == '4':
+            rDict = None if status == None else Round_init(v, Fractions_init(model), triads)
+        else:
+            rDict = None if status == None else Results_init(model)
+    if opt == '4' and rDict != None and status == 'optimal':
+        (status, bound) = ('rounded', Objective_relaxation(v, confidence))
+    if rDict != None and any(sum(rDict[arc]) != 1 for arc in rDict):
+        rDict = None                        # a solver stopped at a limit may return values that are not a solution
+    if rDict == None:                       # stopped at a limit without a solution
+        (rDict, status) = (Labels_results(start or WarmStart_init(v, triads)), 'fallback')
+    elif opt != '3' and len(Violated_init(rDict, triads)) > 0:       # cutting planes stopped at a limit
+        rDict = Labels_results(consistency.Repair_init(Labels_init(rDict), v, triads, closures, maptuple['n']))
+    objective = Objective_init(v, rDict)
+    if status == 'optimal' and options['mipgap'] == None:
+        bound = objective
+    if len(fixed) > 0 and status in ('optimal', 'rounded'):        # optimal for the fixed arcs, not the document
+        (status, bound) = ('heuristic', None)
+    stats = Stats_init(None if start == None else consistency.Objective_init(v, start), objective, status, bound)
+    stats['variables'] = sum(len(reltypes) if domains == None else len(consistency.Bits(domains[arc]))
+                             for arc in v if not arc in fixed)
+    stats['fixed'] = len(fixed)
+    if opt == '3':
+        stats['violations'] = len(broken)
+    if width != None:
+        stats['width'] = width
+    stats['time'] = perf_counter() - begin
+    return rDict
+
+# Bumped whenever a change to the model may change the solution of a document, so older cache entries are not used
+formulationVersion = 2
+
+# Statuses of the solutions kept in the cache - found without stopping at a limit, so the same on any machine
+cacheStatuses = ('optimal', 'rounded', 'heuristic')
+
+# Workers and the model cache only change how the solution is found, so they are not part of the key
+def Cache_key(inDict, opt, options):
+    options = dict((name, options[name]) for name in options if not name in ('models', 'modelsSize'))
+    return diskcache.Key_init(formulationVersion, reltypes, compositerelations, opt, options, inDict)
+
+def main(inDict, opt='1', backend='pyomo', formulation='full', decompose=False, workers=1, warmstart=False, solver='cplex',
+         prune=False, epsilon=None, fix=None, treewidth=None, timelimit=None, mipgap=None, cache=None, cacheSize=1000,
+         models=None, modelsSize=1000, shard=None, overlap=10):
+    global v
+    global numConstraints
+    global numRounds
+    global stats
+    global confidence
+    options = {'backend': backend, 'formulation': formulation, 'warmstart': warmstart, 'solver': solver, 'prune': prune,
+               'epsilon': epsilon, 'fix': fix, 'treewidth': treewidth, 'timelimit': timelimit, 'mipgap': mipgap,
+               'models': models, 'modelsSize': modelsSize}
+    if cache != None:
+        begin = perf_counter()
+        key = Cache_key(inDict, opt, dict(options, decompose=decompose, shard=shard, overlap=overlap))
+        entry = diskcache.Load(cache, key)
+        if entry != None:
+            (rDict, numConstraints, numRounds, stats, confidence) = entry
+            stats = dict(stats, cached=True, time=perf_counter() - begin)
+            v = inDict
+            return rDict
+    if shard != None and opt != '3' and len(set(entity for arc in inDict for entity in arc)) > shard:
+        rDict = Shard_main(inDict, opt, options, workers, shard, overlap)
+    elif decompose:
+        rDict = Decompose_main(inDict, opt, options, workers)
+        v = inDict
+    else:
+        rDict = Solve_main(inDict, opt, options)
+    if cache != None and stats['status'] in cacheStatuses:
+        diskcache.Store(cache, key, (rDict, numConstraints, numRounds, stats, confidence), cacheSize)
+    return rDict
+
+#############################################################################################################
+#
+# Optimise several Final Classifiers in one solver call
+#
+# The entities of document n are renamed "n:id", so no triad joins two documents and the model of the batch is
+# block diagonal - one block per document. Its optimum is the optimum of every document, while the model is built,
+# written and solved once. The time limit is per document, so the batch gets the sum of them.
+# Batching pays where the fixed cost of a solver call dominates. A solver in branchingSolvers branches on the batch
+# as a whole rather than on each block, so an integer batch takes about as long as all its documents branched on
+# together - far longer than the documents one by one, e.g. 4 documents of 12 entities took over 600s with cbc
+# against 20s one by one. With these solvers the documents of opt '1' and '2' are solved one by one instead, and
+# stats reports whether the documents were 'batched'
+def Batch_name(n, id):
+    return str(n) + ":" + id
+
+branchingSolvers = ('cbc', 'glpk')
+batchConfidence = []    # confidence of each document of the last batch with opt '4'
+def Batch_main(inDicts, opt='1', **options):
+    global stats
+    if opt in ('1', '2') and options.get('solver', 'cplex') in branchingSolvers:
+        (results, docStats) = ([], [])
+        for inDict in inDicts:
+            results.append(main(inDict, opt, **options))
+            docStats.append(stats)
+        stats = Stats_init(None, sum(docStat['objective'] for docStat in docStats),
+                           max(['optimal'] + [docStat['status'] for docStat in docStats], key=statusOrder.index))
+        stats['time'] = sum(docStat['time'] for docStat in docStats)
+        stats['batched'] = False
+        del batchConfidence[:]
+        return results
+    batchDict = {}
+    for (n, inDict) in enumerate(inDicts):
+        for (left, right) in inDict:
+            batchDict[(Batch_name(n, left), Batch_name(n, right))] = inDict[(left, right)]
+    if options.get('timelimit') != None:
+        options['timelimit'] = options['timelimit']*len(inDicts)
+    rDict = main(batchDict, opt, **options)
+    stats['batched'] = True
+    results = []
+    del batchConfidence[:]
+    for (n, inDict) in enumerate(inDicts):
+        results.append(dict(((left, right), rDict[(Batch_name(n, left), Batch_name(n, right))]) for (left, right) in inDict))
+        if opt == '4':
+            batchConfidence.append(dict(((left, right), confidence[(Batch_name(n, left), Batch_name(n, right))])
+                                        for (left, right) in inDict))
+    return results
+
+#############################################################################################################
+#
+# Optimise several Final Classifiers in parallel, longest first
+#
+# Each document is one job, and the jobs go to the workers in order of their predicted solve time, longest first,
+# so the last jobs to start are the short ones. The predicted and actual time of every document are kept in
+# timings, and written to timingsFile where given, which then calibrates costModel on the next call. The workers
+# are daemonic processes, which cannot start workers of their own, so each document is solved in its worker with
+# workers=1 - its components or windows one after another with decompose or shard
+#
+# Predicted solve time in seconds of a document: costModel[0] + costModel[1]*arcs + costModel[2]*triads
+costModel = [0.1, 0.001, 0.01]
+
+def Cost_init(numArcs, numTriads):
+    return costModel[0] + costModel[1]*numArcs + costModel[2]*numTriads
+
+# Least-squares fit of costModel to the arcs, triads and actual times recorded by Timings_write
+def Cost_calibrate(filename):
+    rows = [line.strip().split(",") for line in open(filename)][1:]
+    if len(rows) < len(costModel):
+        return
+    sizes = np.array([[1.0, float(row[1]), float(row[2])] for row in rows])
+    actual = np.array([float(row[4]) for row in rows])
+    costModel[:] = np.linalg.lstsq(sizes, actual, rcond=None)[0].tolist()
+    return
+
+def Timings_write(filename):
+    newFile = not os.path.isfile(filename)
+    f = open(filename, 'a')
+    if newFile:
+        f.write("document,arcs,triads,predicted,actual\n")
+    for timing in timings:
+        f.write("%s,%d,%d,%s,%s\n" % timing)
+    f.close()
+    return
+
+# Solve one document - runs in a worker process, so its stats and confidence are returned rather than shared
+def Document_main(args):
+    (n, inDict, opt, options) = args
+    start = perf_counter()
+    rDict = main(inDict, opt, **options)
+    return (n, rDict, stats, confidence, perf_counter() - start)
+
+timings = []        # (document, arcs, triads, predicted, actual) of each document of the last Parallel_main
+batchStats = []     # stats of each document of the last Parallel_main
+def Parallel_main(inDicts, opt='1', workers=2, names=None, timingsFile=None, **options):
+    global timings
+    if timingsFile != None and os.path.isfile(timingsFile):
+        Cost_calibrate(timingsFile)
+    if names == None:
+        names = [str(n) for n in range(len(inDicts))]
+    sizes = [(len(inDict), len(Connected_Arcs_init(inDict))) for inDict in inDicts]
+    predicted = [Cost_init(numArcs, numTriads) for (numArcs, numTriads) in sizes]
+    jobs = [(n, inDicts[n], opt, dict(options, workers=1)) for n in sorted(range(len(inDicts)), key=lambda n: -predicted[n])]
+    if workers > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(min(workers, len(jobs)))
+        done = list(pool.imap_unordered(Document_main, jobs))
+        pool.close()
+        pool.join()
+    else:
+        done = [Document_main(job) for job in jobs]
+    results = [None]*len(inDicts)
+    batchStats[:] = [None]*len(inDicts)
+    batchConfidence[:] = [None]*len(inDicts)
+    actual = [None]*len(inDicts)
+    for (n, rDict, docStats, docConfidence, docTime) in done:
+        (results[n], batchStats[n], batchConfidence[n], actual[n]) = (rDict, docStats, docConfidence, docTime)
+    timings = [(names[n], sizes[n][0], sizes[n][1], predicted[n], actual[n]) for n in range(len(inDicts))]
+    if timingsFile != None:
+        Timings_write(timingsFile)
+    return results
+
+#############################################################################################################
+#
+# Re-optimise a document after its arcs or weights changed, e.g. with a classifier added to or taken out of the
+# ensemble
+#
+# The pyomo model of each document is kept in sessions under the name of the document, with its last labelling.
+# On an update only the weights that changed are set in the objective. Arcs new to the document get their
+# variables, OnlyOneReltype and the Transitivity rules of their new triads. Arcs gone from the document have their
+# variables fixed to 0 and the rules of their triads deactivated until they come back. The solver starts from the
+# last labelling, with new arcs at their heaviest reltype, repaired, so a small change takes few steps to re-solve.
+# Optimises as main with opt '1' and the pyomo backend. With any option of main that changes the model or how it is
+# solved (updateDefaults) set otherwise, or a solver that does not run through Pyomo, the document is optimised by
+# main from scratch instead and its session dropped. stats reports the number of arcs 'changed', 'added' and
+# 'removed' by the update. At most sessionsSize sessions are kept - the least recently updated go first - and
+# Session_clear drops them, e.g. once a sweep over ensembles is done
+sessions = {}
+sessionsSize = 100
+sessionsUsed = 0        # number of updates so far, for the 'used' count of each session
+updateDefaults = {'backend': 'pyomo', 'decompose': False, 'prune': False, 'epsilon': None, 'fix': None,
+                  'treewidth': None, 'cache': None, 'models': None, 'shard': None}
+updateIgnored = ('warmstart', 'workers', 'cacheSize', 'modelsSize', 'overlap')     # always warm started, or unused
+
+# Transitivity rules of the triads of model, by triad
+def Session_rows(model, triads):
+    if hasattr(model, 'Groups'):
+        suffixes = [(group,) for group in model.Groups]
+    else:
+        suffixes = [(arc1RT, arc2RT) for arc1RT in reltypes for arc2RT in reltypes]
+    return dict((triad, [model.Transitivity[triad + suffix] for suffix in suffixes if triad + suffix in model.Transitivity])
+                for triad in triads)
+
+def Session_init(inDict, formulation):
+    global v
+    v = inDict
+    model = Model_init(inDict, formulation, mutable=True)
+    model.Added = ConstraintList()          # rules of the arcs and triads added by Update_main
+    triads = Connected_Arcs_init(inDict)
+    return {'formulation': formulation, 'model': model, 'v': dict(inDict), 'labels': None,
+            'onlyOne': dict((arc, model.OnlyOneReltype[arc]) for arc in inDict),
+            'rows': Session_rows(model, triads), 'active': set(triads)}
+
+# Rules of a triad for the constraints of the formulation, added to model.Added
+def Session_add(model, triad, formulation):
+    (i,j,k) = triad
+    if formulation == 'compact':
+        rules = [CompactTransitivity_rule(model, i, j, k, group) for group in model.Groups]
+    else:
+        rules = [Transitivity_rule(model, i, j, k, arc1RT, arc2RT) for arc1RT in reltypes for arc2RT in reltypes]
+    return [model.Added.add(rule) for rule in rules if not rule is Constraint.Feasible]
+
+def Update_main(name, inDict, formulation='full', solver='cplex', timelimit=None, mipgap=None, **options):
+    global v
+    global numConstraints
+    global numRounds
+    global stats
+    global sessionsUsed
+    unknown = [option for option in options if not option in updateDefaults and not option in updateIgnored]
+    if len(unknown) > 0:
+        raise TypeError("Update_main() got unexpected keyword arguments " + ", ".join(unknown))
+    if solver in ipmatrix.inProcessSolvers or any(options.get(option, updateDefaults[option]) != updateDefaults[option]
+                                                  for option in updateDefaults):
+        Session_clear(name)
+        return main(inDict, '1', formulation=formulation, solver=solver, timelimit=timelimit, mipgap=mipgap, **options)
+    begin = perf_counter()
+    sessionsUsed += 1
+    session = sessions.get(name)
+    if session == None or session['formulation'] != formulation:
+        session = sessions[name] = Session_init(inDict, formulation)
+    session['used'] = sessionsUsed
+    while len(sessions) > sessionsSize:
+        del sessions[min(sessions, key=lambda other: sessions[other]['used'])]
+    model = session['model']
+    known = session['v']
+    (added, removed, changed) = ([arc for arc in inDict if not arc in session['onlyOne']], [], [])
+    for arc in session['onlyOne']:
+        if not arc in inDict:
+            if session['onlyOne'][arc].active:
+                removed.append(arc)
+        elif not session['onlyOne'][arc].active or known[arc] != inDict[arc]:
+            changed.append(arc)
+    for arc in added:
+        model.Arcs.add(arc)
+        for r in range(len(reltypes)):
+            model.Domain.add((arc[0], arc[1], r))
+        session['onlyOne'][arc] = model.Added.add(OnlyOneReltype_rule(model, arc[0], arc[1]))
+    for arc in removed:
+        session['onlyOne'][arc].deactivate()
+        for r in range(len(reltypes)):
+            model.x[arc[0], arc[1], r].fix(0)
+    for arc in changed:
+        session['onlyOne'][arc].activate()
+        for r in range(len(reltypes)):
+            model.x[arc[0], arc[1], r].unfix()
+    for arc in added + changed:
+        for r in range(len(reltypes)):
+            model.Rels[arc[0], arc[1], r] = inDict[arc][r]
+    if len(added) > 0:                      # the objective is a sum over the variables, so it gets the new ones
+        model.del_component(model.Obj)
+        model.Obj = Objective(rule=Obj_rule, sense=maximize)
+    triads = Connected_Arcs_init(inDict)
+    for triad in triads:
+        if not triad in session['rows']:
+            session['rows'][triad] = Session_add(model, triad, formulation)
+    active = set(triads)
+    for triad in session['active'] - active:
+        for row in session['rows'][triad]:
+            row.deactivate()
+    for triad in active - session['active']:
+        for row in session['rows'][triad]:
+            row.activate()
+    session['active'] = active
+    session['v'].update(inDict)
+    v = inDict
+    last = session['labels'] or {}
+    labels = dict((arc, last[arc] if arc in last else Argmax_init(inDict[arc]).index(1)) for arc in inDict)
+    start = consistency.Repair_init(labels, inDict, triads, closures, maptuple['n'])
+    (status, bound) = Model_solve(SolverFactory(solver), model, solver, {'mipgap': mipgap}, start,
+                                  Remaining_init(begin, timelimit))
+    if status == None:
+        (labels, status) = (start, 'fallback')
+    else:
+        labels = dict((arc, max(range(len(reltypes)), key=lambda r: model.x[arc[0], arc[1], r].value or 0))
+                      for arc in inDict)
+        if len(consistency.Violated_init(labels, triads, closures)) > 0:    # stopped at a limit
+            labels = consistency.Repair_init(labels, inDict, triads, closures, maptuple['n'])
+    session['labels'] = labels
+    rDict = Labels_results(labels)
+    objective = Objective_init(inDict, rDict)
+    if status == 'optimal' and mipgap == None:
+        bound = objective
+    numConstraints = sum(1 for row in model.component_data_objects(Constraint, active=True))
+    numRounds = 1
+    stats = Stats_init(consistency.Objective_init(inDict, start), objective, status, bound)
+    stats['changed'] = len(changed)
+    stats['added'] = len(added)
+    stats['removed'] = len(removed)
+    stats['time'] = perf_counter() - begin
+    return rDict
+
+def Session_clear(name=None):
+    if name == None:
+        sessions.clear()
+    else:
+        sessions.pop(name, None)
+    return
+
 if __name__ == "__main__":
-    main(sys.argv[1])
+    main(sys.argv[1])
\ No newline at end of file
@@ -22,7 +22,7 @@ If you use this code, please cite our paper:
 }
 """
 
-from classifier import Classifier
+from classifier import Classifier, Ensemble
 import glob
 import os.path
 import sys
@@ -48,7 +48,16 @@ formulas = ["1","2","3","4","5","6","7","8","9"]  # '1' = proportion of classifi
                                           # '7' = hinge loss
                                           # '8' = square loss
                                           # '9' = log loss
-opt = '1'
+opt = '1'                                 # '0' = relType with maximum probability
+                                          # '1' = optimise
+                                          # '2' = optimise with cutting planes
+                                          # '3' = local search, without a solver
+                                          # '4' = LP relaxation, rounded, with the confidence of each TLINK
+options = {}                              # passed on to optimizer.main
+statsFile = None                          # CSV file that gets the optimizer status, objective, MIP gap and time per file
+batchSize = 1                             # number of files optimised together in one solver call
+parallel = 1                              # number of files optimised at once, one per process, see optimizer.Parallel_main
+timingsFile = None                        # CSV file of predicted and actual solve times, calibrates the order of parallel files
  
 for arg in sys.argv:
     if arg[:4] == "dir=":
@@ -67,6 +76,52 @@ for arg in sys.argv:
             exit()        
     if arg[:4] == "opt=":
         opt = arg[4:]
+    if arg[:8] == "backend=":
+        options['backend'] = arg[8:]
+    if arg[:10] == "decompose=":
+        options['decompose'] = arg[10:] == '1'
+    if arg[:8] == "workers=":
+        options['workers'] = int(arg[8:])
+    if arg[:6] == "shard=":
+        options['shard'] = int(arg[6:])
+    if arg[:8] == "overlap=":
+        options['overlap'] = int(arg[8:])
+    if arg[:10] == "warmstart=":
+        options['warmstart'] = arg[10:] == '1'
+    if arg[:7] == "solver=":
+        options['solver'] = arg[7:]
+    if arg[:6] == "prune=":
+        options['prune'] = arg[6:] == '1'
+    if arg[:8] == "epsilon=":
+        options['epsilon'] = float(arg[8:])
+    if arg[:4] == "fix=":
+        options['fix'] = float(arg[4:])
+    if arg[:10] == "treewidth=":
+        options['treewidth'] = int(arg[10:])
+    if arg[:10] == "timelimit=":
+        options['timelimit'] = float(arg[10:])
+    if arg[:7] == "mipgap=":
+        options['mipgap'] = float(arg[7:])
+    if arg[:6] == "cache=":
+        options['cache'] = arg[6:]
+    if arg[:10] == "cachesize=":
+        options['cacheSize'] = int(arg[10:])
+    if arg[:7] == "models=":
+        options['models'] = arg[7:]
+    if arg[:11] == "modelssize=":
+        options['modelsSize'] = int(arg[11:])
+    if arg[:6] == "batch=":
+        batchSize = int(arg[6:])
+    if arg[:9] == "parallel=":
+        parallel = int(arg[9:])
+    if arg[:8] == "timings=":
+        timingsFile = arg[8:]
+    if arg[:7] == "parser=":                  # 'bs4' or 'lxml', see Classifier.parser
+        Classifier.setParser(arg[7:])
+    if arg[:11] == "parsecache=":              # directory of parsed tml files, see Classifier.readTml
+        Classifier.setParseCache(arg[11:] or None)
+    if arg[:6] == "stats=":
+        statsFile = arg[6:]
         
 # list of classifiers - sub-directories starting with CLASSIFIER_
 classifiers = []                                        # initialise list of classifiers
@@ -85,13 +140,17 @@ filelist = glob.glob(clList[0]+"/"+classFile)           # Lists the files in the
 if len(filelist) == 0:
     print "No files in directory ", clList[0]
     exit()
+if parallel > 1 and batchSize == 1:                  # the files are spread over the processes all at once
+    batchSize = len(filelist)
 
 try:
+    batch = []                                          # files waiting for the solver when batchSize > 1 or parallel > 1
     for filename in filelist:                               # for each file in the first directory
-        finalClassifier = Classifier("FINAL", True)         # TLINKS and probability of relTypes across ALL classifiers goes here
-        finalClassifier.setWeightFormula(weight, weightFormula) # determine which weighting formula to use
+        document = Ensemble()                               # state of this file, shared by its classifiers
+        finalClassifier = Classifier("FINAL", True, document) # TLINKS and probability of relTypes across ALL classifiers goes here
+        document.setWeightFormula(weight, weightFormula) # determine which weighting formula to use
         for classifier in clList:                           # for each classifier
-            clName = Classifier(classifier, False)          # Classifier object instantiated for each classifier
+            clName = Classifier(classifier, False, document) # Classifier object instantiated for each classifier
             cFilename = filename.replace(clList[0],classifier)  # file path is replaced by classifier path name
             if os.path.isfile(cFilename):                   # parse the file for events, timex3, makeinstance and tlinks
                 print "Calling parseTml ", cFilename, classifier
@@ -99,15 +158,42 @@ try:
             else:
                 print "File ", cFilename, "not found"
 
-	print Classifier.globalArcs     
+	print document.globalArcs     
         v = finalClassifier.arcProbability()                # Dictionary of probabilities across multiple classifiers
+        if opt in ('1', '2', '3', '4') and (batchSize > 1 or parallel > 1):   # files wait for their batch
+            batch.append((filename, finalClassifier, v))
+            if len(batch) == batchSize or filename == filelist[-1]:
+                if parallel > 1:                        # a process per file, see optimizer.Parallel_main
+                    fileOptions = dict((name, options[name]) for name in options if name != 'workers')   # one process per file
+                    results = optimizer.Parallel_main([doc[2] for doc in batch], opt, parallel, [doc[0] for doc in batch],
+                                                      timingsFile, **fileOptions)
+                    if statsFile != None:
+                        for (n, doc) in enumerate(batch):
+                            optimizer.Stats_write(statsFile, doc[0], optimizer.batchStats[n])
+                else:                                   # a solver call per batch, see optimizer.Batch_main
+                    results = optimizer.Batch_main([doc[2] for doc in batch], opt, **options)
+                    if statsFile != None:
+                        optimizer.Stats_write(statsFile, "+".join(doc[0] for doc in batch))
+                for (n, (docname, docClassifier, docV)) in enumerate(batch):
+                    docClassifier.mapResults(results[n], optimizer.batchConfidence[n] if opt == '4' else None)
+                batch = []
+            continue
 #        print v
-        if opt == '1':
-            result = optimizer.main(v)                     # optimise to maximise probability of reltypes
+        confidence = None
+        if opt in ('1', '2', '3', '4'):
+            result = optimizer.main(v, opt, **options)      # optimise to maximise probability of reltypes
+            if opt == '4':
+                confidence = optimizer.confidence           # LP relaxation value of each reltype, written to the TLINKs
+            if statsFile != None:
+                optimizer.Stats_write(statsFile, filename)
+            if 'violations' in optimizer.stats and optimizer.stats['violations'] > 0:   # local search stopped at the time limit
+                print filename, "local search left", optimizer.stats['violations'], "broken triads"
+            if 'gap' in optimizer.stats:                # warm start was used
+                print filename, "warm start", optimizer.stats['start'], "optimum", optimizer.stats['objective'], "gap", optimizer.stats['gap']
         else:
             result = finalClassifier.maxProbability(v)      # get relType with maximum probability
  
-        finalClassifier.mapResults(result)                  # create new tml in folder RESULTS
+        finalClassifier.mapResults(result, confidence)      # create new tml in folder RESULTS
 except Exception as X:
     print X
 
@@ -79,6 +79,7 @@ ensembles = {"2-9-5":(2,9,5),
 
 #ensembles = {"UT reltype only":(1, 2, 3)} 
 dirName  = "Training-"          # start of folder names - will be concatenated with alphanumeric code for classifier
+parseCache = "PARSED"           # directory of the parse cache shared by all runs of the sweep - "" for none
 weights  = (8,)              # all weights
 formulas = (2,)                 # divide by sum of options finding arc
 options  = (0,)                # 0,1 - with and without optimizer
@@ -107,7 +108,7 @@ try:
                 f = str(formula)
                 o = str(opt)
                 print "Processing ensemble",eList,"with option",o,", formula",f,", weight",w, ", and convexifying coefficient", convexifying
-                result = ensemble.main([eList,"weight="+w,"formula="+f,"opt="+o,"convexifying="+str(convexifying)])
+                result = ensemble.main([eList,"weight="+w,"formula="+f,"opt="+o,"parsecache="+parseCache,"convexifying="+str(convexifying)])
                 #print "Ensemble is", result
                 if result:
                     (f1, pr, re) = tempeval.main(["x","Platinum","RESULTS",0])
@@ -76,6 +76,7 @@ ensembles = {"2-9-5":(2,9,5),
 
 #ensembles = {"UT reltype only":(1, 2, 3)} 
 dirName  = "Training-"          # start of folder names - will be concatenated with alphanumeric code for classifier
+parseCache = "PARSED"           # directory of the parse cache shared by all runs of the sweep - "" for none
 weights  = (1,2,3,4,5,6,7)      # all weights
 formulas = (2,)                 # divide by sum of classifiers finding arc
 options  = (0,1)                # 0,1 - with and without optimizer
@@ -96,7 +97,7 @@ for eName in ensembles:
                 f = str(formula)
                 o = str(opt)
                 print "Processing ensemble",eList,"with option",o,", formula",f,", and weight",w
-                result = ensemble.main([eList,"weight="+w,"formula="+f,"opt="+o])
+                result = ensemble.main([eList,"weight="+w,"formula="+f,"opt="+o,"parsecache="+parseCache])
                 if result:
                     (f1, pr, re) = tempeval.main(["x","Platinum-training","RESULTS",0])
                     (f1x, prx, rex, matched) = newmetric.main(["ref=Platinum-training","sys=RESULTS"])